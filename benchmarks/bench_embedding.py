@@ -0,0 +1,64 @@
+"""
+Embedding throughput on CPU, single process vs. sharded across worker processes
+
+Usage:
+    python benchmarks/bench_embedding.py [--chunks 4096] [--batch_size 32] [--workers 1 2 4 8] [--threads 1]
+"""
+from typing import List, Tuple
+import argparse
+import os
+import random
+import time
+import numpy as np
+import torch
+from que.config import QUECONFIG
+from que.embeddings import ShardedSentenceTransformerEmbeddingFunction
+
+def make_chunks(n_chunks: int, chunk_size: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    vocabulary = [ ''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(2, 10))) for _ in range(5_000) ]
+    return [
+        ' '.join(rng.choices(vocabulary, k=rng.randint(chunk_size // 2, chunk_size)))
+        for _ in range(n_chunks)
+    ]
+
+def bench(ef: ShardedSentenceTransformerEmbeddingFunction, chunks: List[str]) -> Tuple[float, np.ndarray]:
+    # warm up the model, and the worker pool if any
+    ef(chunks[: ef.batch_size * max(ef.workers, 1) * 2])
+
+    start = time.perf_counter()
+    embeddings = np.array(ef(chunks), dtype=np.float32)
+    elapsed = time.perf_counter() - start
+
+    return len(chunks) / elapsed, embeddings
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=4_096)
+    parser.add_argument('--batch_size', type=int, default=QUECONFIG['documents']['embedding_batch_size'])
+    parser.add_argument('--workers', type=int, nargs='+', default=[ n for n in (2, 4, 8, 16) if n <= os.cpu_count() ])
+    # torch threads of the main process and of every worker
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+
+    model_name = QUECONFIG['documents']['embedding_model']
+    chunks = make_chunks(args.chunks, QUECONFIG['documents']['chunk_size'])
+
+    print(f'model={model_name} chunks={len(chunks)} batch_size={args.batch_size} threads={args.threads} cores={os.cpu_count()}')
+
+    baseline_ef = ShardedSentenceTransformerEmbeddingFunction(model_name, device='cpu', workers=0, batch_size=args.batch_size)
+    baseline_rate, baseline = bench(baseline_ef, chunks)
+    print(f'workers=1 (in process)\t{baseline_rate:8.1f} chunks/s\tx1.00')
+
+    for workers in args.workers:
+        ef = ShardedSentenceTransformerEmbeddingFunction(model_name, device='cpu', workers=workers, batch_size=args.batch_size)
+        rate, embeddings = bench(ef, chunks)
+        ef.close()
+
+        is_identical = embeddings.tobytes() == baseline.tobytes()
+        print(f'workers={workers}\t\t\t{rate:8.1f} chunks/s\tx{rate / baseline_rate:.2f}\tidentical={is_identical}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+from typing import Any, Callable, Dict, List, Tuple
+from concurrent.futures import Executor
+from functools import partial
+import asyncio
+import threading
+from llama_cpp import Llama
+from que.store import DirectoryStore
+from que.lock import ReadWriteLock
+from que.models import make_model, llm_do_chat
+
+async def run_in_executor(executor: Executor | None, fn: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking function in an executor
+
+    Args:
+        executor: The executor to run `fn` in. The event loop default executor is used if `None`
+        fn: The blocking function
+
+    Returns:
+        The result of `fn(*args, **kwargs)`
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(fn, *args, **kwargs))
+
+
+class AsyncDirectoryStore:
+    """
+    Asyncio wrapper around `DirectoryStore`. Extraction, embedding and retrieval run in an executor,
+    so they never block the event loop, and any number of queries can run concurrently.
+    Refreshes run one at a time, and queries wait for a running refresh, since it may switch the store to a new index generation
+
+    Cancelling or timing out an awaited call stops waiting for it, but a refresh already running in
+    the executor completes in the background
+    """
+
+    def __init__(self, store: DirectoryStore, executor: Executor | None = None) -> None:
+        self.store = store
+        self.executor = executor
+        # held by queries as readers, and by anything that modifies the store as the writer
+        self.store_lock = ReadWriteLock()
+
+    @classmethod
+    async def open(
+        cls,
+        *args,
+        executor: Executor | None = None,
+        timeout: float | None = None,
+        **kwargs
+        ) -> 'AsyncDirectoryStore':
+        """
+        Open a `DirectoryStore` in an executor
+
+        Args and kwargs are those of `DirectoryStore`
+
+        Kwargs:
+            executor: The executor for blocking work. The event loop default executor is used if `None`
+            timeout: The maximum time to wait for the store to open and refresh, in seconds
+
+        Returns:
+            The async store
+        """
+        store = await asyncio.wait_for(
+            run_in_executor(executor, DirectoryStore, *args, **kwargs),
+            timeout
+        )
+        return cls(store, executor=executor)
+
+    async def refresh(self, timeout: float | None = None) -> bool:
+        """
+        Update the store to the current directory and file system state. See `DirectoryStore.refresh`
+
+        Kwargs:
+            timeout: The maximum time to wait, in seconds
+
+        Returns:
+            `True` if the store was refreshed, `False` if it was skipped
+        """
+        return await asyncio.wait_for(
+            run_in_executor(self.executor, self.refresh_blocking),
+            timeout
+        )
+
+    def refresh_blocking(self) -> bool:
+        with self.store_lock.write():
+            return self.store.refresh()
+
+    async def query(
+        self,
+        query_txt: str,
+        k: int,
+        dir_scope: str | None = None,
+        mode: str = 'vector',
+        timeout: float | None = None,
+        ) -> Dict:
+        """
+        Query the store for related documents. See `DirectoryStore.query`
+
+        Args:
+            query_txt: The query, in text form
+            k: The number of documents to retrieve
+
+        Kwargs:
+            dir_scope: Restrict the query to documents within the `dir_scope` folder
+            mode: The retrieval mode, see `DirectoryStore.query`
+            timeout: The maximum time to wait, in seconds
+
+        Returns:
+            Raw DB query results
+        """
+        return await asyncio.wait_for(
+            run_in_executor(self.executor, self.query_blocking, query_txt, k, dir_scope=dir_scope, mode=mode),
+            timeout
+        )
+
+    def query_blocking(self, query_txt: str, k: int, dir_scope: str | None = None, mode: str = 'vector') -> Dict:
+        while True:
+            with self.store_lock.read():
+                if not self.store.needs_reload():
+                    return self.store.query_open_generation(query_txt, k, dir_scope=dir_scope, mode=mode)
+
+            # follow migrations made by other processes, once no query is using the current generation
+            with self.store_lock.write():
+                self.store.reload_active_generation()
+
+    def format_context(self, context: Dict, context_template: str) -> str:
+        return self.store.format_context(context, context_template)
+
+
+class AsyncLlm:
+    """
+    Asyncio wrapper around a `Llama` instance. Generation runs in an executor, one request at a time,
+    since a `Llama` instance cannot serve concurrent completions
+
+    Cancelling or timing out a generation stops it at the next token
+    """
+
+    def __init__(self, llm: Llama, executor: Executor | None = None) -> None:
+        self.llm = llm
+        self.executor = executor
+        self.lock = asyncio.Lock()
+
+    @classmethod
+    async def load(
+        cls,
+        model_id: str,
+        quant: str,
+        executor: Executor | None = None,
+        **kwargs
+        ) -> 'AsyncLlm':
+        """
+        Load a model in an executor. See `make_model`
+
+        Args:
+            model_id: A Huggingface model repo
+            quant: a valid expression pointing to a .gguf file in the `model_id` repository
+
+        Kwargs:
+            executor: The executor for blocking work. The event loop default executor is used if `None`
+
+        Returns:
+            The async model
+        """
+        llm = await run_in_executor(executor, make_model, model_id, quant, **kwargs)
+        return cls(llm, executor=executor)
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        is_verbose: bool = False,
+        max_tokens: int | None = None,
+        timeout: float | None = None,
+        ) -> str:
+        """
+        Generate text from the given messages. See `llm_do_chat`
+
+        Args:
+            messages: The message log for llm completion
+
+        Kwargs:
+            is_verbose: Enable verbose logging
+            max_tokens: The maximum number of tokens to generate. Unbounded if `None`
+            timeout: The maximum time to wait for the model and generation, in seconds
+
+        Returns:
+            The generated llm text
+        """
+        return await asyncio.wait_for(
+            self.chat_locked(messages, is_verbose=is_verbose, max_tokens=max_tokens),
+            timeout
+        )
+
+    async def chat_locked(
+        self,
+        messages: List[Dict[str, str]],
+        is_verbose: bool = False,
+        max_tokens: int | None = None,
+        ) -> str:
+
+        async with self.lock:
+            stop = threading.Event()
+            generation = asyncio.ensure_future(run_in_executor(
+                self.executor,
+                llm_do_chat,
+                self.llm,
+                messages,
+                is_verbose=is_verbose,
+                max_tokens=max_tokens,
+                should_stop=stop.is_set
+            ))
+
+            try:
+                return await asyncio.shield(generation)
+            except asyncio.CancelledError:
+                stop.set()
+                # keep the model locked until the generation has actually stopped
+                await asyncio.wait([generation])
+                raise
+
+
+async def answer(
+    store: AsyncDirectoryStore,
+    llm: AsyncLlm,
+    query: str,
+    k: int,
+    query_system_prompt: str,
+    context_template: str,
+    dir_scope: str | None = None,
+    query_mode: str = 'vector',
+    is_verbose: bool = False,
+    max_tokens: int | None = None,
+    timeout: float | None = None,
+    ) -> Tuple[str, Dict]:
+    """
+    Answer a query from the store documents
+
+    Retrieval runs concurrently with other requests, and generation waits for its turn on the model
+
+    Args:
+        store: The async document store
+        llm: The async model
+        query: The user query
+        k: The number of documents to retrieve
+        query_system_prompt: The system prompt for the query
+        context_template: The template to use for displaying context
+
+    Kwargs:
+        dir_scope: Restrict document retrieval to the specified directory
+        query_mode: The retrieval mode, see `DirectoryStore.query`
+        is_verbose: Enable verbose logging
+        max_tokens: The maximum number of tokens to generate. Unbounded if `None`
+        timeout: The maximum time for retrieval and generation, in seconds
+
+    Returns:
+        The generated llm response, and the retrieved context
+    """
+
+    async def do_answer() -> Tuple[str, Dict]:
+        context = await store.query(query, k, dir_scope=dir_scope, mode=query_mode)
+
+        messages = [
+            {
+                "role": "system",
+                "content": query_system_prompt.format(context=store.format_context(context, context_template))
+            },
+            {
+                "role": "user",
+                "content": query
+            }
+        ]
+
+        llm_response = await llm.chat(messages, is_verbose=is_verbose, max_tokens=max_tokens)
+        return llm_response, context
+
+    return await asyncio.wait_for(do_answer(), timeout)
@@ -0,0 +1,161 @@
+from typing import List, Tuple
+import hashlib
+import os
+import zlib
+
+class TextCache:
+    """
+    Compressed on-disk cache of the text extracted from documents
+
+    Entries are keyed by (path, fingerprint, reader version), so an entry is never served
+    for a file that changed or that would now be read differently.
+    The least recently used entries are evicted when the cache grows over `max_size_bytes`
+
+    A read only cache serves the existing entries without writing to disk
+    """
+
+    def __init__(
+            self,
+            cache_folder: str | os.PathLike,
+            max_size_bytes: int,
+            compression_level: int = 6,
+            read_only: bool = False,
+        ) -> None:
+
+        self.cache_folder = cache_folder
+        self.max_size_bytes = max_size_bytes
+        self.compression_level = compression_level
+        self.read_only = read_only
+        # computed on first write, then tracked incrementally
+        self.size_bytes: int | None = None
+
+        if not self.read_only and not os.path.exists(self.cache_folder):
+            os.makedirs(self.cache_folder)
+
+    def entry_path(
+            self,
+            abs_fname: str | os.PathLike,
+            fingerprint: str,
+            reader_version: str
+        ) -> str:
+        """
+        Args:
+            abs_fname: The absolute path of the document
+            fingerprint: The document fingerprint
+            reader_version: The version of the reader used to extract the text
+
+        Returns:
+            The path of the cache entry for the document
+        """
+        key = f'{abs_fname}<//>{fingerprint}<//>{reader_version}'.encode('utf-8')
+        return os.path.join(self.cache_folder, hashlib.sha1(key).hexdigest() + '.z')
+
+    def get(
+            self,
+            abs_fname: str | os.PathLike,
+            fingerprint: str,
+            reader_version: str
+        ) -> str | None:
+        """
+        Get the cached text of a document
+
+        Args:
+            abs_fname: The absolute path of the document
+            fingerprint: The document fingerprint
+            reader_version: The version of the reader used to extract the text
+
+        Returns:
+            The extracted text, or `None` if it is not cached
+        """
+        entry_fname = self.entry_path(abs_fname, fingerprint, reader_version)
+
+        try:
+            with open(entry_fname, 'rb') as f:
+                txt = zlib.decompress(f.read()).decode('utf-8')
+            # mark as recently used
+            if not self.read_only: os.utime(entry_fname)
+        except (FileNotFoundError, zlib.error):
+            return None
+
+        return txt
+
+    def put(
+            self,
+            abs_fname: str | os.PathLike,
+            fingerprint: str,
+            reader_version: str,
+            txt: str
+        ):
+        """
+        Store the extracted text of a document, evicting old entries if the cache is over its size cap.
+        Nothing is stored in a read only cache
+
+        Args:
+            abs_fname: The absolute path of the document
+            fingerprint: The document fingerprint
+            reader_version: The version of the reader used to extract the text
+            txt: The extracted text
+        """
+        if self.read_only:
+            return
+
+        entry_fname = self.entry_path(abs_fname, fingerprint, reader_version)
+        compressed = zlib.compress(txt.encode('utf-8'), self.compression_level)
+
+        if len(compressed) > self.max_size_bytes:
+            return
+
+        # an overwritten entry no longer takes up its previous size
+        try:
+            replaced_size = os.stat(entry_fname).st_size
+        except FileNotFoundError:
+            replaced_size = 0
+
+        # write-then-rename, so that concurrent readers never see a partial entry
+        tmp_fname = f'{entry_fname}.{os.getpid()}.tmp'
+        with open(tmp_fname, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp_fname, entry_fname)
+
+        if self.size_bytes is None:
+            self.size_bytes = sum(size for _, size, _ in self.entries())
+        else:
+            self.size_bytes += len(compressed) - replaced_size
+
+        if self.size_bytes > self.max_size_bytes:
+            self.evict()
+
+    def entries(self) -> List[Tuple[float, int, str]]:
+        """
+        Returns:
+            A list of `(last_used, size, path)` for every cache entry
+        """
+        entries = []
+        with os.scandir(self.cache_folder) as it:
+            for entry in it:
+                if not entry.name.endswith('.z'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """
+        Delete the least recently used entries until the cache is within its size cap
+        """
+        entries = self.entries()
+        total_size = sum(size for _, size, _ in entries)
+
+        for _, size, entry_fname in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            try:
+                os.remove(entry_fname)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+        self.size_bytes = total_size
@@ -1,14 +1,167 @@
 import argparse
 from que.store import DirectoryStore
 from que.models import make_model, oneshot_session, continue_as_interactive_session
-from que.config import QUECONFIG
+from que.config import QUECONFIG, CONFIG_FOLDER
+from que.latency import LatencyBudget, load_model_rates, save_model_rates, update_model_rates, estimate_tokens, count_tokens, pack_context, timed_chat, TOKENS_PER_WORD_ESTIMATE, TOKENS_PER_CHUNK_PATH
 from json import loads
-from typing import Dict
+from typing import Dict, List
 from os import path
 from pprint import pprint
+import re
+import sys
+import time
+
+def main():
+    """
+    Entry point of the `que` command. Dispatches to a subcommand if the first argument names one,
+    and queries the documents otherwise
+    """
+
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        return COMMANDS[sys.argv[1]](sys.argv[2:])
+
+    return main_query()
+
+def make_store(is_verbose: bool, refresh: bool = True, background_migration: bool = True, read_only: bool = False) -> DirectoryStore:
+    """
+    Open the document store with the loaded configuration
+
+    Args:
+        is_verbose: Enable verbosity
+
+    Kwargs:
+        refresh: Update the store to the current directory and file system state
+        background_migration: Start building a new index generation in the background if the embedding model changed
+        read_only: Open the store without writing to it. Implies `refresh=False` and `background_migration=False`
+
+    Returns:
+        The document store
+    """
+
+    return DirectoryStore(
+        chunk_size=QUECONFIG['documents']['chunk_size'],
+        chunk_step=QUECONFIG['documents']['chunk_step'],
+        is_verbose=is_verbose,
+        st_embedding_model=QUECONFIG['documents']['embedding_model'],
+        text_cache_max_size_mb=QUECONFIG['cache']['max_size_mb'],
+        refresh=refresh and not read_only,
+        background_migration=background_migration and not read_only,
+        read_only=read_only,
+        refresh_lock_timeout=QUECONFIG['index']['refresh_lock_timeout'],
+        embedding_workers=QUECONFIG['documents']['embedding_workers'],
+        embedding_batch_size=QUECONFIG['documents']['embedding_batch_size'],
+    )
+
+def main_reindex(argv: List[str]):
+
+    parser = argparse.ArgumentParser(prog='que reindex')
+
+    parser.add_argument(
+        '--rechunk',
+        help='Rebuild the chunks and embeddings of indexed files from the extracted text cache, using the current chunk_size and chunk_step',
+        action='store_true'
+    )
+
+    parser.add_argument(
+        '-v',
+        '--verbose',
+        help='Enable verbosity',
+        action='store_true',
+        default=QUECONFIG['verbose']
+    )
+
+    args = parser.parse_args(argv)
+
+    db = make_store(args.verbose, refresh=False)
+
+    if args.rechunk:
+        db.rechunk()
+
+    db.refresh()
+
+def main_migrate(argv: List[str]):
+
+    parser = argparse.ArgumentParser(prog='que migrate')
+
+    parser.add_argument(
+        '-v',
+        '--verbose',
+        help='Enable verbosity',
+        action='store_true',
+        default=QUECONFIG['verbose']
+    )
+
+    args = parser.parse_args(argv)
+
+    db = make_store(args.verbose, refresh=False, background_migration=False)
+    db.migrate()
+
+def main_export(argv: List[str]):
+    from que.snapshot import export_snapshot
+
+    parser = argparse.ArgumentParser(prog='que export')
+
+    parser.add_argument(
+        'snapshot',
+        help='The snapshot file to write (.npz)',
+    )
+
+    parser.add_argument(
+        '-r',
+        '--root',
+        help='Export the documents under this directory, with paths relative to it',
+        default='.'
+    )
+
+    parser.add_argument(
+        '-v',
+        '--verbose',
+        help='Enable verbosity',
+        action='store_true',
+        default=QUECONFIG['verbose']
+    )
+
+    args = parser.parse_args(argv)
+
+    db = make_store(args.verbose, read_only=True)
+    n_exported = export_snapshot(db, args.snapshot, root=args.root)
+    print(f'Exported {n_exported} text snippets to {args.snapshot}')
+
+def main_import(argv: List[str]):
+    from que.snapshot import import_snapshot
+
+    parser = argparse.ArgumentParser(prog='que import')
+
+    parser.add_argument(
+        'snapshot',
+        help='The snapshot file to read (.npz)',
+    )
+
+    parser.add_argument(
+        '-r',
+        '--root',
+        help='The directory the snapshot paths are relative to',
+        default='.'
+    )
+
+    parser.add_argument(
+        '-v',
+        '--verbose',
+        help='Enable verbosity',
+        action='store_true',
+        default=QUECONFIG['verbose']
+    )
+
+    args = parser.parse_args(argv)
+
+    db = make_store(args.verbose, refresh=False)
+    n_imported = import_snapshot(db, args.snapshot, root=args.root)
+    print(f'Imported {n_imported} text snippets from {args.snapshot}')
 
 def main_query(*args, **kwargs):
 
+    start = time.monotonic()
+
     parser = argparse.ArgumentParser()
 
     parser.add_argument(
@@ -45,6 +198,37 @@ def main_query(*args, **kwargs):
         action='store_true',
     )
 
+    parser.add_argument(
+        '-nr',
+        '--no-refresh',
+        help='Query the existing index in read-only mode, without indexing new or changed files',
+        action='store_true',
+    )
+
+    query_mode_group = parser.add_mutually_exclusive_group()
+
+    query_mode_group.add_argument(
+        '-lx',
+        '--lexical',
+        help='Retrieve documents by keyword match on their text and file path only. The embedding model is only loaded if the index refresh embeds new or changed files',
+        action='store_true',
+    )
+
+    query_mode_group.add_argument(
+        '-hy',
+        '--hybrid',
+        help='Retrieve documents by fusing the keyword match and embedding similarity rankings',
+        action='store_true',
+    )
+
+    parser.add_argument(
+        '-d',
+        '--deadline',
+        help='Answer within this many seconds. Retrieval, context size and answer length are adjusted to the measured speed of the model, and a partial answer is returned if the deadline is hit. Implies --no-refresh',
+        type=float,
+        default=None
+    )
+
     parser.add_argument(
         '-v',
         '--verbose',
@@ -61,28 +245,38 @@ def main_query(*args, **kwargs):
     is_verbose = args.verbose
     is_query_only = args.query_only
     is_interactive = args.interactive
+    query_mode = 'lexical' if args.lexical else ('hybrid' if args.hybrid else 'vector')
 
     err_msg_both_interactive_and_query_only_flags = f'Query only flag = {is_query_only} and Interactive flag = {is_interactive}, but only one is allowed'
     assert is_query_only ^ is_interactive or (is_query_only == is_interactive and not is_interactive), err_msg_both_interactive_and_query_only_flags
+    assert args.deadline is None or not is_interactive, 'The deadline flag cannot be used in interactive sessions'
     
     if is_verbose:
         print('Loaded configuration:')
         pprint(QUECONFIG)
 
-    db = DirectoryStore(
-        chunk_size=QUECONFIG['documents']['chunk_size'],
-        chunk_step=QUECONFIG['documents']['chunk_step'],
-        is_verbose=is_verbose,
-        st_embedding_model=QUECONFIG['documents']['embedding_model'],
-    )
+    # indexing new files could take longer than the whole deadline
+    is_read_only = args.no_refresh or (args.deadline is not None and not is_query_only)
+
+    try:
+        db = make_store(is_verbose, read_only=is_read_only)
+    except FileNotFoundError as e:
+        if not is_read_only: raise
+        # no index to read from
+        exit(str(e))
 
     is_scoped_local_search = args.local
     dir_scope = None if not is_scoped_local_search else '.'
 
+    if args.deadline is not None and not is_query_only:
+        print(answer_within_deadline(db, query, k, args.deadline, start, dir_scope=dir_scope, query_mode=query_mode, is_verbose=is_verbose))
+        exit()
+
     context = db.query(
         args.query,
         k,
-        dir_scope=dir_scope
+        dir_scope=dir_scope,
+        mode=query_mode
     )
 
     if is_query_only:
@@ -123,9 +317,138 @@ def main_query(*args, **kwargs):
         QUECONFIG['prompts']['context_template'],
         is_verbose=is_verbose,
         print_hook=format_context_highlight,
-        dir_scope=dir_scope
+        dir_scope=dir_scope,
+        query_mode=query_mode
     )
     
+def answer_within_deadline(
+        db: DirectoryStore,
+        query: str,
+        k_max: int,
+        deadline_s: float,
+        start: float,
+        dir_scope: str | None = None,
+        query_mode: str = 'vector',
+        is_verbose: bool = False,
+    ) -> str:
+    """
+    Answer a query within a deadline, sizing retrieval, context and generation after the measured rates of the model.
+    The rates measured in this run are persisted for the next ones
+
+    Args:
+        db: The document store
+        query: The user query
+        k_max: The maximum number of document chunks to use as context
+        deadline_s: The time allowed for the answer, in seconds
+        start: The `time.monotonic()` the deadline is counted from
+
+    Kwargs:
+        dir_scope: Restrict document retrieval to the specified directory
+        query_mode: The retrieval mode, see `DirectoryStore.query`
+        is_verbose: Enable verbose logging
+
+    Returns:
+        The formatted answer, which is partial if the deadline was hit
+    """
+
+    model_key = f"{QUECONFIG['model']['model_id']}/{QUECONFIG['model']['quant']}"
+    system_prompt = QUECONFIG['prompts']['system_prompt']
+    context_template = QUECONFIG['prompts']['context_template']
+
+    rates = load_model_rates(CONFIG_FOLDER, model_key)
+    budget = LatencyBudget(deadline_s, rates, start=start)
+
+    k = budget.plan_k(
+        k_max,
+        prompt_tokens=estimate_tokens(system_prompt.format(context='') + query),
+        tokens_per_chunk=estimate_tokens(context_template) + TOKENS_PER_CHUNK_PATH + int(db.chunk_size * TOKENS_PER_WORD_ESTIMATE),
+    )
+    if is_verbose: print(f'Deadline in {budget.remaining():.2f}s. Retrieving {k} document chunks')
+
+    context = db.query(query, k, dir_scope=dir_scope, mode=query_mode)
+
+    if budget.remaining() < rates['load_s']:
+        return format_partial_answer('', context)
+
+    load_start = time.monotonic()
+    llm = make_model(
+        QUECONFIG['model']['model_id'],
+        QUECONFIG['model']['quant'],
+        is_verbose=is_verbose
+    )
+    load_s = time.monotonic() - load_start
+
+    # planned with the time left after loading the model, so that the context is evaluated in time
+    prompt_tokens = count_tokens(llm, system_prompt.format(context='')) + count_tokens(llm, query)
+    if not budget.can_evaluate(prompt_tokens):
+        return format_partial_answer('', context)
+
+    max_context_tokens, max_tokens = budget.plan(prompt_tokens)
+    packed_context = pack_context(llm, context, context_template, max_context_tokens)
+    if is_verbose: print(f'Deadline in {budget.remaining():.2f}s. Using {len(packed_context["documents"][0])} document chunks and generating up to {max_tokens} tokens')
+
+    messages = [
+        {
+          "role": "system", 
+          "content": system_prompt.format(context=db.format_context(packed_context, context_template))
+        },
+        {
+          "role": "user",
+          "content": query
+        }
+    ]
+
+    llm_response, stop_reason, measured = timed_chat(llm, messages, budget, max_tokens, is_verbose=is_verbose)
+
+    save_model_rates(CONFIG_FOLDER, model_key, update_model_rates(rates, { **measured, 'load_s': load_s }))
+
+    if stop_reason != 'deadline':
+        try:
+            return format_context_highlight(llm_response, packed_context)
+        except (ValueError, KeyError):
+            # cut by the token cap, or not the expected JSON blob
+            pass
+
+    return format_partial_answer(llm_response, context, stop_reason=stop_reason)
+
+# why an answer is incomplete, by the reason generation stopped
+PARTIAL_ANSWER_NOTES = {
+    'deadline': 'deadline reached, answer is incomplete',
+    'length': 'answer length limit reached, answer is incomplete',
+    'stop': 'answer is not in the expected format',
+}
+
+def format_partial_answer(llm_response: str, context: Dict, stop_reason: str = 'deadline') -> str:
+    """
+    Format an answer that could not be completed, followed by the retrieved sources
+
+    Args:
+        llm_response: The partial llm response, possibly empty
+        context: The retrieved context
+
+    Kwargs:
+        stop_reason: Why generation stopped, see `timed_chat`
+
+    Returns:
+        The formatted partial answer
+    """
+
+    # the answer is the first field of the JSON blob, so it is usually readable even when the blob is cut
+    partial_answer = re.search(r'"answer"\s*:\s*"((?:[^"\\]|\\.)*)', llm_response)
+    partial_answer = partial_answer.group(1) if partial_answer is not None else llm_response
+
+    res = ''
+    if partial_answer.strip() != '':
+        res += highlight(partial_answer.strip() + '...') + '\n\n'
+    res += '-'*10 + PARTIAL_ANSWER_NOTES[stop_reason] + '-'*10 + '\n\n'
+    res += 'Retrieved sources:\n'
+
+    sources = dict.fromkeys(meta['source'] for meta in context['metadatas'][0])
+    for source in sources:
+        res += f"\t{source.replace( path.expanduser('~'), '~' )}\n"
+
+    return res
+
 def highlight(s):
     return "\x1b[1;32m" + s + "\x1b[0m"
 
@@ -147,4 +470,14 @@ def format_context_highlight(llm_response: Dict[str, str], context: Dict) -> str
             if fname == meta['source'] and exact_snip in doc_text:
                 res += f"{meta['source'].replace( path.expanduser('~'), '~' )}:\n{doc_text}\n\n".replace(exact_snip, highlight(exact_snip))
 
-    return res
\ No newline at end of file
+    return res
+
+COMMANDS = {
+    'reindex': main_reindex,
+    'migrate': main_migrate,
+    'export': main_export,
+    'import': main_import,
+}
+
+if __name__ == '__main__':
+    main()
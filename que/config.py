@@ -67,6 +67,27 @@ def assert_config_format(config: Dict[str, Any]):
     
     
 
+def fill_missing_from_default(config: Dict[str, Any], default_config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fill the optional fields that are missing in a user configuration with their default values,
+    so that configuration files written by older versions keep working
+
+    Args:
+        config: The user configuration
+        default_config: The default configuration
+
+    Returns:
+        The user configuration, with the missing fields taken from `default_config`
+    """
+
+    for field, default_value in default_config.items():
+        if field not in config:
+            config[field] = default_value
+        elif isinstance(default_value, dict) and isinstance(config[field], dict):
+            fill_missing_from_default(config[field], default_value)
+
+    return config
+
 def load_or_create_config() -> Dict[str, Any]:
     f"""
     Loads a config file at {USR_CONFIG_PATH} if it is present and contains expected fields, or loads the default file if not
@@ -83,6 +104,7 @@ def load_or_create_config() -> Dict[str, Any]:
                 config = toml.load(f)
 
             assert_config_format(config)
+            config = fill_missing_from_default(config, load_default_config())
             needs_regen = False
         except Exception as e:
             # any exception was in the read body or in assert_correct_format.
@@ -0,0 +1,126 @@
+from typing import List
+from concurrent.futures import ProcessPoolExecutor
+import atexit
+import multiprocessing
+import threading
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+# the model loaded in each worker process
+worker_model = None
+
+def init_embedding_worker(model_name: str, device: str, threads: int):
+    global worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    # the same number of threads as the parent process, a different one could change the floating point results
+    torch.set_num_threads(threads)
+    worker_model = SentenceTransformer(model_name, device=device)
+
+def encode_batch(batch: List[str], normalize_embeddings: bool) -> np.ndarray:
+    return worker_model.encode(
+        batch,
+        batch_size=len(batch),
+        convert_to_numpy=True,
+        normalize_embeddings=normalize_embeddings
+    )
+
+
+class ShardedSentenceTransformerEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    A sentence-transformers embedding function that shards batches across a pool of worker processes
+
+    Inputs are split into batches exactly as `SentenceTransformer.encode` splits them (sorted by decreasing length,
+    `batch_size` at a time), so every batch is padded and encoded as it would be in a single process, and the
+    embeddings are byte-identical to single-process ones. Workers encode with the torch thread count of this process, so limit it
+    (`torch.set_num_threads` or `OMP_NUM_THREADS`) to keep the workers from oversubscribing the cores. With `workers <= 1`,
+    encoding runs in this process
+
+    The model is only loaded when something is first embedded. The embedding function can be called from several threads at once
+    """
+
+    def __init__(
+            self,
+            model_name: str,
+            device: str,
+            workers: int = 0,
+            batch_size: int = 32,
+            normalize_embeddings: bool = False,
+        ) -> None:
+
+        self.model_name = model_name
+        self.device = device
+        self.workers = workers
+        self.batch_size = batch_size
+        self.normalize_embeddings = normalize_embeddings
+        self.model = None
+        self.pool: ProcessPoolExecutor | None = None
+        # so that concurrent first calls load a single model or pool
+        self.load_lock = threading.Lock()
+
+    def __call__(self, input: Documents) -> Embeddings:
+        sentences = list(input)
+
+        if self.workers <= 1 or len(sentences) <= self.batch_size:
+            return self.get_model().encode(
+                sentences,
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=self.normalize_embeddings
+            ).tolist()
+
+        # same batching as `SentenceTransformer.encode`
+        length_sorted_idx = np.argsort([ -len(sentence) for sentence in sentences ])
+        batches = [
+            [ sentences[idx] for idx in length_sorted_idx[i : i + self.batch_size] ]
+            for i in range(0, len(sentences), self.batch_size)
+        ]
+
+        encoded_batches = self.get_pool().map(
+            encode_batch,
+            batches,
+            [self.normalize_embeddings] * len(batches)
+        )
+
+        embeddings = np.concatenate(list(encoded_batches))
+        embeddings = embeddings[np.argsort(length_sorted_idx)]
+        return embeddings.tolist()
+
+    def get_model(self):
+        """
+        Returns:
+            The in-process model, loaded on first use
+        """
+        with self.load_lock:
+            if self.model is None:
+                from sentence_transformers import SentenceTransformer
+
+                self.model = SentenceTransformer(self.model_name, device=self.device)
+        return self.model
+
+    def get_pool(self) -> ProcessPoolExecutor:
+        """
+        Returns:
+            The worker pool, started on first use
+        """
+        with self.load_lock:
+            if self.pool is None:
+                import torch
+
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=init_embedding_worker,
+                    initargs=(self.model_name, self.device, torch.get_num_threads()),
+                )
+                atexit.register(self.close)
+        return self.pool
+
+    def close(self):
+        """
+        Stop the worker pool, if started
+        """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
@@ -0,0 +1,83 @@
+from typing import Tuple
+import hashlib
+import os
+
+# results of `check_file`
+FILE_UNCHANGED = 'unchanged'
+FILE_TOUCHED = 'touched'
+FILE_CHANGED = 'changed'
+FILE_DELETED = 'deleted'
+
+def get_file_fingerprint(abs_fname: str | os.PathLike) -> str:
+    """
+    Calculate a fingerprint of the file metadata. Cheap, but changes on touch, copy or checkout
+
+    Args:
+        abs_fname: The absolute path of the file to fingerprint
+
+    Returns:
+        The file fingerprint
+    """
+
+    fstat = os.stat(abs_fname)
+
+    f_info = f'{abs_fname}<//>{fstat.st_size}-{fstat.st_mtime}-{fstat.st_ctime}'.encode('utf-8')
+
+    return hashlib.md5(f_info).hexdigest()
+
+def get_content_digest(abs_fname: str | os.PathLike, block_size: int = 1 << 20) -> str:
+    """
+    Calculate a digest of the file contents, reading the file in blocks
+
+    Unlike `get_file_fingerprint`, the digest does not change when a file is touched, copied or checked out again
+
+    Args:
+        abs_fname: The absolute path of the file to hash
+
+    Kwargs:
+        block_size: The number of bytes read at a time
+
+    Returns:
+        The content digest
+    """
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(abs_fname, 'rb') as f:
+        while block := f.read(block_size):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+def check_file(
+        abs_fname: str | os.PathLike,
+        stored_fingerprint: str,
+        stored_digest: str | None,
+    ) -> Tuple[str, str | None, str | None]:
+    """
+    Compare a file with the fingerprint and content digest it was indexed with. The contents are only hashed
+    when the fingerprint differs
+
+    Args:
+        abs_fname: The absolute path of the file
+        stored_fingerprint: The fingerprint the file was indexed with
+        stored_digest: The content digest the file was indexed with. `None` for files indexed before digests were recorded
+
+    Returns:
+        One of `FILE_UNCHANGED`, `FILE_TOUCHED` (the fingerprint changed, but the contents did not), `FILE_CHANGED` or `FILE_DELETED`,
+        then the current fingerprint and content digest. The digest is `None` if it was not calculated
+    """
+
+    if not os.path.exists(abs_fname):
+        return FILE_DELETED, None, None
+
+    # 1st tier: file metadata
+    current_fingerprint = get_file_fingerprint(abs_fname)
+    if current_fingerprint == stored_fingerprint:
+        return FILE_UNCHANGED, current_fingerprint, stored_digest
+
+    # 2nd tier: file contents
+    current_digest = get_content_digest(abs_fname)
+    if current_digest == stored_digest:
+        return FILE_TOUCHED, current_fingerprint, current_digest
+
+    return FILE_CHANGED, current_fingerprint, current_digest
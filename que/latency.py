@@ -0,0 +1,276 @@
+from typing import TYPE_CHECKING, Dict, List, Tuple
+import json
+import os
+import time
+
+if TYPE_CHECKING:
+    # the budget planning is usable without loading llama.cpp
+    from llama_cpp import Llama
+
+MODEL_RATES_FNAME = 'model_rates.json'
+
+# used to size retrieval before the model, and its tokenizer, are loaded
+TOKENS_PER_WORD_ESTIMATE = 1.5
+# tokens taken by the file path of a context chunk, on average
+TOKENS_PER_CHUNK_PATH = 24
+
+# used until the loaded model has been measured once. Deliberately pessimistic
+DEFAULT_MODEL_RATES = {
+    'load_s': 10.0,
+    'prompt_eval_tps': 100.0,
+    'generation_tps': 5.0,
+}
+
+def load_model_rates(config_folder: str | os.PathLike, model_key: str) -> Dict[str, float]:
+    """
+    Load the measured rates of a model
+
+    Args:
+        config_folder: The que config folder
+        model_key: An identifier of the model and quantization
+
+    Returns:
+        The load time, in seconds, and the prompt evaluation and generation rates, in tokens/s
+    """
+
+    try:
+        with open(f'{config_folder}/{MODEL_RATES_FNAME}', 'r') as f:
+            all_rates = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        all_rates = {}
+
+    return { **DEFAULT_MODEL_RATES, **all_rates.get(model_key, {}) }
+
+def save_model_rates(config_folder: str | os.PathLike, model_key: str, rates: Dict[str, float]):
+    """
+    Persist the measured rates of a model
+
+    Args:
+        config_folder: The que config folder
+        model_key: An identifier of the model and quantization
+        rates: The model rates
+    """
+
+    rates_fname = f'{config_folder}/{MODEL_RATES_FNAME}'
+    try:
+        with open(rates_fname, 'r') as f:
+            all_rates = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        all_rates = {}
+
+    all_rates[model_key] = rates
+
+    tmp_fname = f'{rates_fname}.{os.getpid()}.tmp'
+    with open(tmp_fname, 'w') as f:
+        json.dump(all_rates, f, indent=2)
+    os.replace(tmp_fname, rates_fname)
+
+def update_model_rates(rates: Dict[str, float], measured: Dict[str, float], smoothing: float = 0.5) -> Dict[str, float]:
+    """
+    Blend new measurements into the known rates with an exponential moving average
+
+    Args:
+        rates: The known rates
+        measured: The new measurements. May hold only some of the rates
+
+    Kwargs:
+        smoothing: The weight of the new measurements
+
+    Returns:
+        The updated rates
+    """
+
+    return {
+        key: (1 - smoothing) * value + smoothing * measured[key] if key in measured else value
+        for key, value in rates.items()
+    }
+
+
+class LatencyBudget:
+    """
+    Splits the time left before a deadline between prompt evaluation and generation, based on the measured model rates
+
+    Args:
+        deadline_s: The time allowed for the whole answer, in seconds, counted from `start`
+        rates: The model rates
+
+    Kwargs:
+        start: The `time.monotonic()` the deadline is counted from. Now if `None`
+        max_generation_tokens: The maximum number of tokens to generate, however much time is left
+        min_generation_tokens: The number of tokens always reserved for generation
+        safety_margin: The fraction of the remaining time kept unallocated to absorb estimation errors
+    """
+
+    def __init__(
+            self,
+            deadline_s: float,
+            rates: Dict[str, float],
+            start: float | None = None,
+            max_generation_tokens: int = 512,
+            min_generation_tokens: int = 48,
+            safety_margin: float = 0.1,
+        ) -> None:
+
+        self.start = time.monotonic() if start is None else start
+        self.deadline = self.start + deadline_s
+        self.rates = rates
+        self.max_generation_tokens = max_generation_tokens
+        self.min_generation_tokens = min_generation_tokens
+        self.safety_margin = safety_margin
+
+    def remaining(self) -> float:
+        """
+        Returns:
+            The seconds left before the deadline
+        """
+        return self.deadline - time.monotonic()
+
+    def is_expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def plan(self, prompt_tokens: int, model_is_loaded: bool = True) -> Tuple[int, int]:
+        """
+        Plan the context size and generation cap that fit in the remaining time
+
+        Args:
+            prompt_tokens: The number of prompt tokens besides the retrieved context
+
+        Kwargs:
+            model_is_loaded: If `False`, the time to load the model is also deducted
+
+        Returns:
+            The number of context tokens and the maximum number of tokens to generate
+        """
+
+        available_s = self.remaining() * (1 - self.safety_margin)
+        if not model_is_loaded:
+            available_s -= self.rates['load_s']
+
+        # generation gets at most half of the time, context the rest
+        generation_tokens = int(0.5 * available_s * self.rates['generation_tps'])
+        generation_tokens = max(self.min_generation_tokens, min(self.max_generation_tokens, generation_tokens))
+
+        prompt_eval_s = available_s - generation_tokens / self.rates['generation_tps']
+        context_tokens = int(prompt_eval_s * self.rates['prompt_eval_tps']) - prompt_tokens
+
+        return max(0, context_tokens), generation_tokens
+
+    def plan_k(self, k_max: int, prompt_tokens: int, tokens_per_chunk: int) -> int:
+        """
+        Plan the number of chunks to retrieve, before the model is loaded
+
+        Args:
+            k_max: The number of chunks requested
+            prompt_tokens: The estimated number of prompt tokens besides the retrieved context
+            tokens_per_chunk: The estimated number of tokens per chunk
+
+        Returns:
+            The number of chunks to retrieve, between 1 and `k_max`
+        """
+
+        context_tokens, _ = self.plan(prompt_tokens, model_is_loaded=False)
+        return max(1, min(k_max, context_tokens // max(1, tokens_per_chunk)))
+
+    def can_evaluate(self, prompt_tokens: int) -> bool:
+        """
+        Unlike generation, prompt evaluation cannot be stopped at the deadline, so it is only started if it is expected to end in time
+
+        Args:
+            prompt_tokens: The number of prompt tokens
+
+        Returns:
+            `True` if the prompt is expected to be evaluated before the deadline
+        """
+        return prompt_tokens / self.rates['prompt_eval_tps'] <= self.remaining() * (1 - self.safety_margin)
+
+
+def estimate_tokens(txt: str) -> int:
+    return int(TOKENS_PER_WORD_ESTIMATE * len(txt.split()))
+
+def count_tokens(llm: 'Llama', txt: str) -> int:
+    return len(llm.tokenize(txt.encode('utf-8'), add_bos=False, special=True))
+
+def pack_context(llm: 'Llama', context: Dict, context_template: str, max_context_tokens: int) -> Dict:
+    """
+    Keep the best ranked retrieved chunks that fit in `max_context_tokens`
+
+    Args:
+        llm: The model, used to count tokens
+        context: Raw DB query results
+        context_template: The template used for displaying context
+        max_context_tokens: The maximum number of context tokens
+
+    Returns:
+        The DB query results, restricted to the chunks that fit
+    """
+
+    n_fitting = 0
+    used_tokens = 0
+    for snippet, meta in zip(context['documents'][0], context['metadatas'][0]):
+        used_tokens += count_tokens(llm, context_template.format(fname=meta['source'], snippet=snippet.strip()))
+        if used_tokens > max_context_tokens:
+            break
+        n_fitting += 1
+
+    return {
+        **context,
+        **{
+            key: [ context[key][0][:n_fitting] ]
+            for key in ('ids', 'documents', 'metadatas', 'distances') if context.get(key) is not None
+        },
+    }
+
+def timed_chat(
+        llm: 'Llama',
+        messages: List[Dict[str, str]],
+        budget: LatencyBudget,
+        max_tokens: int,
+        is_verbose: bool = False,
+    ) -> Tuple[str, str, Dict[str, float]]:
+    """
+    Generate text from the given messages, stopping at the deadline, and measure the model rates
+
+    Args:
+        llm: A LLama2 instance
+        messages: The message log for llm completion
+        budget: The latency budget
+        max_tokens: The maximum number of tokens to generate
+
+    Kwargs:
+        is_verbose: Enable verbose logging
+
+    Returns:
+        The generated llm text, why generation stopped, and the measured rates. Generation stops at the `'deadline'`,
+        at the `'length'` limit of `max_tokens`, or at the end of the answer, `'stop'`
+    """
+
+    from que.models import llm_do_chat
+
+    prompt_tokens = sum(count_tokens(llm, message['content']) for message in messages)
+    token_times = []
+    is_stopped = []
+
+    def should_stop() -> bool:
+        token_times.append(time.monotonic())
+        if budget.is_expired():
+            is_stopped.append(True)
+        return len(is_stopped) > 0
+
+    start = time.monotonic()
+    llm_response = llm_do_chat(llm, messages, is_verbose=is_verbose, max_tokens=max_tokens, should_stop=should_stop)
+
+    measured = {}
+    if len(token_times) > 0:
+        measured['prompt_eval_tps'] = prompt_tokens / max(token_times[0] - start, 1e-3)
+    if len(token_times) > 1:
+        measured['generation_tps'] = (len(token_times) - 1) / max(token_times[-1] - token_times[0], 1e-3)
+
+    if len(is_stopped) > 0:
+        stop_reason = 'deadline'
+    elif len(token_times) >= max_tokens:
+        # `should_stop` is checked once per streamed chunk, about once per token
+        stop_reason = 'length'
+    else:
+        stop_reason = 'stop'
+
+    return llm_response, stop_reason, measured
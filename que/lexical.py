@@ -0,0 +1,173 @@
+from typing import Dict, List
+import os
+import sqlite3
+from urllib.request import pathname2url
+
+# BM25 weights of the chunk text and of the source path, so that file names can be searched, but rank below the text
+BM25_WEIGHTS = (1.0, 0.5)
+
+class LexicalIndex:
+    """
+    A BM25 keyword index of the document chunks, backed by SQLite FTS5
+
+    It mirrors the chunks of the vector index, and answers queries without any embedding model.
+    Both the chunk text and the path of its file are searched.
+    A read only index never writes to disk. If its file does not exist, it is empty
+    """
+
+    def __init__(self, index_fname: str | os.PathLike, read_only: bool = False) -> None:
+        self.index_fname = index_fname
+        self.read_only = read_only
+
+        if self.read_only and os.path.exists(self.index_fname):
+            self.db = sqlite3.connect(f'file:{pathname2url(os.path.abspath(self.index_fname))}?mode=ro', uri=True, check_same_thread=False)
+            return
+
+        self.db = sqlite3.connect(':memory:' if self.read_only else self.index_fname, check_same_thread=False)
+        with self.db:
+            fts_columns = [ row[1] for row in self.db.execute('PRAGMA table_info(chunks)') ]
+            if fts_columns == ['document']:
+                # built before sources were searchable. Emptied, so that the store rebuilds it from the vector index
+                self.db.execute('DROP TABLE chunks')
+                self.db.execute('DELETE FROM chunk_ids')
+
+            # chunk ids and sources live in a regular table, so they can be looked up by index
+            self.db.execute('CREATE TABLE IF NOT EXISTS chunk_ids (rowid INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, source TEXT NOT NULL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS chunk_ids_source ON chunk_ids (source)')
+            self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(document, source, tokenize='unicode61')")
+
+    def count(self) -> int:
+        """
+        Returns:
+            The number of indexed chunks
+        """
+        return self.db.execute('SELECT count(*) FROM chunk_ids').fetchone()[0]
+
+    def upsert(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, str]]):
+        """
+        Add chunks to the index, replacing the chunks with the same ids
+
+        Args:
+            ids: The chunk ids
+            documents: The chunk texts
+            metadatas: The chunk metadatas. Only the `source` is kept
+        """
+        with self.db:
+            self.db.executemany('DELETE FROM chunks WHERE rowid IN (SELECT rowid FROM chunk_ids WHERE id = ?)', [ (doc_id,) for doc_id in ids ])
+            self.db.executemany('DELETE FROM chunk_ids WHERE id = ?', [ (doc_id,) for doc_id in ids ])
+            self.insert(ids, documents, metadatas)
+
+    def insert(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, str]]):
+        for doc_id, document, meta in zip(ids, documents, metadatas):
+            rowid = self.db.execute('INSERT INTO chunk_ids (id, source) VALUES (?, ?)', (doc_id, meta['source'])).lastrowid
+            self.db.execute('INSERT INTO chunks (rowid, document, source) VALUES (?, ?, ?)', (rowid, document, meta['source']))
+
+    def delete_sources(self, sources: List[str]):
+        """
+        Delete every chunk of the given files
+
+        Args:
+            sources: The absolute paths of the files
+        """
+        with self.db:
+            self.db.executemany('DELETE FROM chunks WHERE rowid IN (SELECT rowid FROM chunk_ids WHERE source = ?)', [ (source,) for source in sources ])
+            self.db.executemany('DELETE FROM chunk_ids WHERE source = ?', [ (source,) for source in sources ])
+
+    def rebuild(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, str]]):
+        """
+        Replace the whole index
+
+        Args:
+            ids: The chunk ids
+            documents: The chunk texts
+            metadatas: The chunk metadatas. Only the `source` is kept
+        """
+        with self.db:
+            self.db.execute('DELETE FROM chunks')
+            self.db.execute('DELETE FROM chunk_ids')
+            self.insert(ids, documents, metadatas)
+
+    @staticmethod
+    def to_match_expression(query_txt: str) -> str:
+        """
+        Convert free text into an FTS5 query matching any of its terms. Every term is quoted,
+        so identifiers and paths are matched as phrases instead of being parsed as FTS5 syntax
+
+        Args:
+            query_txt: The query, in text form
+
+        Returns:
+            The FTS5 match expression
+        """
+        terms = [ term.replace('"', '""') for term in query_txt.split() ]
+        return ' OR '.join(f'"{term}"' for term in terms if term.strip('"') != '')
+
+    def query(self, query_txt: str, k: int, dir_scope: str | None = None) -> Dict:
+        """
+        Query the index for the chunks that best match the query terms, in their text or source path, ranked by BM25
+
+        Args:
+            query_txt: The query, in text form
+            k: The number of chunks to retrieve
+
+        Kwargs:
+            dir_scope: Restrict the query to files within the absolute `dir_scope` folder
+
+        Returns:
+            Results with the same layout as the vector DB query results
+        """
+        match_expression = self.to_match_expression(query_txt)
+
+        rows = []
+        if match_expression != '':
+            if dir_scope is None:
+                rows = self.db.execute(
+                    'SELECT c.id, c.source, chunks.document, bm25(chunks, ?, ?) AS score FROM chunks JOIN chunk_ids c ON c.rowid = chunks.rowid '
+                    'WHERE chunks MATCH ? ORDER BY score LIMIT ?',
+                    (*BM25_WEIGHTS, match_expression, k)
+                ).fetchall()
+            else:
+                dir_prefix = dir_scope.rstrip(os.sep) + os.sep
+                rows = self.db.execute(
+                    'SELECT c.id, c.source, chunks.document, bm25(chunks, ?, ?) AS score FROM chunks JOIN chunk_ids c ON c.rowid = chunks.rowid '
+                    'WHERE chunks MATCH ? AND substr(c.source, 1, ?) = ? ORDER BY score LIMIT ?',
+                    (*BM25_WEIGHTS, match_expression, len(dir_prefix), dir_prefix, k)
+                ).fetchall()
+
+        return {
+            'ids': [ [ row[0] for row in rows ] ],
+            'documents': [ [ row[2] for row in rows ] ],
+            'metadatas': [ [ { 'source': row[1] } for row in rows ] ],
+            'distances': [ [ row[3] for row in rows ] ],
+        }
+
+
+def reciprocal_rank_fusion(results: List[Dict], k: int, rank_constant: int = 60) -> Dict:
+    """
+    Fuse several rankings of chunks with reciprocal rank fusion
+
+    Args:
+        results: DB query results, each holding a single ranking
+        k: The number of chunks to keep
+
+    Kwargs:
+        rank_constant: Dampens the weight of the top ranks
+
+    Returns:
+        Results with the same layout as the vector DB query results, holding the `k` best fused chunks
+    """
+    scores = {}
+    chunks = {}
+    for result in results:
+        for rank, (doc_id, document, meta) in enumerate(zip(result['ids'][0], result['documents'][0], result['metadatas'][0])):
+            scores[doc_id] = scores.get(doc_id, 0) + 1 / (rank_constant + rank + 1)
+            chunks.setdefault(doc_id, (document, meta))
+
+    fused_ids = sorted(scores, key=scores.get, reverse=True)[:k]
+
+    return {
+        'ids': [ fused_ids ],
+        'documents': [ [ chunks[doc_id][0] for doc_id in fused_ids ] ],
+        'metadatas': [ [ chunks[doc_id][1] for doc_id in fused_ids ] ],
+        'distances': [ [ -scores[doc_id] for doc_id in fused_ids ] ],
+    }
@@ -0,0 +1,143 @@
+from contextlib import contextmanager
+import os
+import threading
+import time
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+class FileLock:
+    """
+    An inter-process lock backed by a lock file
+
+    The lock is released by the OS if the holding process dies, so a crashed process never leaves a stale lock behind
+
+    A shared lock can be held by several processes at once, and keeps the exclusive lock from being acquired.
+    Shared locks are not supported on Windows, where they are exclusive
+
+    A read only lock never creates or writes its lock file. It cannot be acquired if the file does not exist or cannot be opened
+    """
+
+    def __init__(self, lock_fname: str | os.PathLike, shared: bool = False, read_only: bool = False) -> None:
+        self.lock_fname = lock_fname
+        self.shared = shared
+        self.read_only = read_only
+        self.fd: int | None = None
+
+    def try_acquire(self) -> bool:
+        """
+        Try to acquire the lock without blocking
+
+        Returns:
+            `True` if the lock was acquired, `False` if another process holds it, or a read only lock file could not be opened
+        """
+        assert self.fd is None, f'Lock {self.lock_fname} is already held by this process'
+
+        if self.read_only:
+            try:
+                fd = os.open(self.lock_fname, os.O_RDONLY)
+            except OSError:
+                return False
+        else:
+            fd = os.open(self.lock_fname, os.O_RDWR | os.O_CREAT, 0o644)
+
+        try:
+            if os.name == 'nt':
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(fd, (fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+
+        self.fd = fd
+        return True
+
+    def acquire(self, timeout: float | None = None, poll_interval: float = 0.1) -> bool:
+        """
+        Acquire the lock, waiting for other processes to release it
+
+        Kwargs:
+            timeout: The maximum time to wait, in seconds. Wait forever if `None`
+            poll_interval: The time between attempts, in seconds
+
+        Returns:
+            `True` if the lock was acquired, `False` if the timeout expired
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while not self.try_acquire():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_interval)
+
+        return True
+
+    def release(self):
+        """
+        Release the lock, if held
+        """
+        if self.fd is None:
+            return
+
+        if os.name == 'nt':
+            msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+        self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class ReadWriteLock:
+    """
+    A lock between the threads of a process, held either by any number of readers or by a single writer
+
+    Writers waiting for the lock keep new readers from acquiring it, so that a steady flow of readers does not starve them
+    """
+
+    def __init__(self) -> None:
+        self.condition = threading.Condition()
+        self.n_readers = 0
+        self.n_waiting_writers = 0
+        self.is_writing = False
+
+    @contextmanager
+    def read(self):
+        """
+        Hold the lock as a reader for the duration of the `with` block
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: not self.is_writing and self.n_waiting_writers == 0)
+            self.n_readers += 1
+        try:
+            yield self
+        finally:
+            with self.condition:
+                self.n_readers -= 1
+                self.condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        """
+        Hold the lock as the writer for the duration of the `with` block
+        """
+        with self.condition:
+            self.n_waiting_writers += 1
+            self.condition.wait_for(lambda: not self.is_writing and self.n_readers == 0)
+            self.n_waiting_writers -= 1
+            self.is_writing = True
+        try:
+            yield self
+        finally:
+            with self.condition:
+                self.is_writing = False
+                self.condition.notify_all()
@@ -85,7 +85,8 @@ def continue_as_interactive_session(
         context_template: str,
         print_hook: None | Callable = None,
         is_verbose: bool = False, 
-        dir_scope: str | None = None
+        dir_scope: str | None = None,
+        query_mode: str = 'vector'
     ):
     """
     Continues an existing query as an interactive LLM chat
@@ -100,6 +101,7 @@ def continue_as_interactive_session(
     Kwargs:
         is_verbose: Enable verbose logging
         dir_scope: Restrict document retrieval to the specified directory
+        query_mode: The retrieval mode, see `DirectoryStore.query`
     """
 
     print()
@@ -112,7 +114,8 @@ def continue_as_interactive_session(
             followup_context = db.query(
                 followup_query,
                 k_for_query,
-                dir_scope=dir_scope
+                dir_scope=dir_scope,
+                mode=query_mode
             )
 
             messages += [
@@ -142,7 +145,9 @@ def continue_as_interactive_session(
 def llm_do_chat(
         llm: Llama, 
         messages: List[Dict[str, str]],
-        is_verbose: bool = False
+        is_verbose: bool = False,
+        max_tokens: int | None = None,
+        should_stop: Callable[[], bool] | None = None,
     ) -> str:
     """
     Generate text from the given messages
@@ -153,17 +158,22 @@ def llm_do_chat(
 
     Kwargs:
         is_verbose: Enable verbose logging
+        max_tokens: The maximum number of tokens to generate. Unbounded if `None`
+        should_stop: If provided, checked after every generated token. Generation stops early when it returns `True`
 
     Returns:
-        The generated llm text
+        The generated llm text, which is partial if generation was stopped by `should_stop`
     """
 
     if is_verbose:
         pprint(messages)
 
+    if should_stop is not None:
+        return llm_do_chat_stream(llm, messages, should_stop, is_verbose=is_verbose, max_tokens=max_tokens)
+
     llm_response = llm.create_chat_completion(
         messages=messages,
-        max_tokens=None,
+        max_tokens=max_tokens,
         stop=["Q:", "\n\n", '<|endoftext|>'],
     )
 
@@ -172,4 +182,50 @@ def llm_do_chat(
         print()
 
     llm_response = llm_response['choices'][0]['message']['content'].strip()
-    return llm_response
\ No newline at end of file
+    return llm_response
+
+def llm_do_chat_stream(
+        llm: Llama,
+        messages: List[Dict[str, str]],
+        should_stop: Callable[[], bool],
+        is_verbose: bool = False,
+        max_tokens: int | None = None,
+    ) -> str:
+    """
+    Generate text from the given messages token by token, stopping early when `should_stop` returns `True`
+
+    Args:
+        llm: A LLama2 instance
+        messages: The message log for llm completion
+        should_stop: Checked after every generated token
+
+    Kwargs:
+        is_verbose: Enable verbose logging
+        max_tokens: The maximum number of tokens to generate. Unbounded if `None`
+
+    Returns:
+        The generated llm text, which is partial if generation was stopped
+    """
+
+    llm_stream = llm.create_chat_completion(
+        messages=messages,
+        max_tokens=max_tokens,
+        stop=["Q:", "\n\n", '<|endoftext|>'],
+        stream=True,
+    )
+
+    llm_response = ''
+    try:
+        for chunk in llm_stream:
+            llm_response += chunk['choices'][0]['delta'].get('content') or ''
+            if should_stop():
+                if is_verbose: print('Generation stopped early')
+                break
+    finally:
+        llm_stream.close()
+
+    if is_verbose:
+        pprint(llm_response)
+        print()
+
+    return llm_response.strip()
@@ -0,0 +1,268 @@
+from typing import Callable, Dict, List, Tuple
+from dataclasses import dataclass, field
+from importlib import import_module
+from importlib.metadata import entry_points
+from warnings import warn
+import os
+
+READER_ENTRY_POINT_GROUP = 'que.readers'
+
+# Cost classes, ordered from cheapest to most expensive to extract
+COST_CLASSES = ('cheap', 'moderate', 'expensive')
+
+@dataclass
+class DocumentReader:
+    """
+    A document reader declaration
+
+    Reader libraries are not imported when a `DocumentReader` is declared, only when `read` is first called.
+    Third-party packages can expose their own readers in the `que.readers` entry point group
+
+    Attrs:
+        name: The reader name
+        extensions: The file extensions (without the leading dot) handled by the reader
+        cost: The cost class of the reader, one of `COST_CLASSES`. Used to schedule cheaper files first
+        version: The reader version. Bump it whenever the extracted text for the same file may change
+        target: A `module:function` path to the function that reads a file into text
+    """
+    name: str
+    extensions: Tuple[str, ...]
+    cost: str
+    version: str
+    target: str
+    _read_fn: Callable[[str | os.PathLike], str] | None = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        assert self.cost in COST_CLASSES, f'Reader {self.name} declares cost "{self.cost}", expected one of {COST_CLASSES}'
+
+    def read(self, abs_fname: str | os.PathLike) -> str:
+        """
+        Read a file, importing the reader implementation on first use
+
+        Args:
+            abs_fname: The absolute path of the file to read
+
+        Returns:
+            The text content of the file
+        """
+        if self._read_fn is None:
+            module_name, fn_name = self.target.split(':')
+            module = import_module(module_name)
+            self._read_fn = getattr(module, fn_name)
+
+        return self._read_fn(abs_fname)
+
+
+class ReaderRegistry:
+    """
+    Registry mapping file extensions to document readers
+
+    Readers are discovered through the `que.readers` entry point group the first time the registry is used
+    """
+
+    def __init__(self, builtin_readers: List[DocumentReader] = []) -> None:
+        self.builtin_readers = builtin_readers
+        self.readers_by_ext: Dict[str, DocumentReader] | None = None
+
+    def discover(self) -> Dict[str, DocumentReader]:
+        """
+        Discover readers declared as entry points. Built-in readers are registered first,
+        so that they are available when running from a source tree, and can be overriden by plugins
+
+        Returns:
+            A mapping of file extension to reader
+        """
+        if self.readers_by_ext is not None:
+            return self.readers_by_ext
+
+        readers_by_ext = {}
+        for reader in self.builtin_readers:
+            self.register(reader, readers_by_ext)
+
+        for entry_point in entry_points(group=READER_ENTRY_POINT_GROUP):
+            try:
+                reader = entry_point.load()
+            except Exception as e:
+                warn(f'Could not load document reader {entry_point.name}: {str(e)}')
+                continue
+
+            if reader in self.builtin_readers:
+                continue
+
+            self.register(reader, readers_by_ext)
+
+        self.readers_by_ext = readers_by_ext
+        return readers_by_ext
+
+    @staticmethod
+    def register(reader: DocumentReader, readers_by_ext: Dict[str, DocumentReader]):
+        for ext in reader.extensions:
+            readers_by_ext[ext.lstrip('.').lower()] = reader
+
+    def extensions(self) -> List[str]:
+        """
+        Returns:
+            The file extensions supported by the registered readers
+        """
+        return list(self.discover().keys())
+
+    def get(self, abs_fname: str | os.PathLike) -> DocumentReader | None:
+        """
+        Get the reader for a file
+
+        Args:
+            abs_fname: The absolute path of the file
+
+        Returns:
+            The reader for the file extension, or `None` if no reader supports it
+        """
+        doctype = os.path.splitext(abs_fname)[1].lstrip('.').lower()
+        return self.discover().get(doctype)
+
+    def cost_rank(self, abs_fname: str | os.PathLike) -> int:
+        """
+        Args:
+            abs_fname: The absolute path of the file
+
+        Returns:
+            The position of the file reader's cost class in `COST_CLASSES`
+        """
+        reader = self.get(abs_fname)
+        return COST_CLASSES.index(reader.cost) if reader is not None else len(COST_CLASSES)
+
+    def read(self, abs_fname: str | os.PathLike) -> str:
+        """
+        Read a file using the reader registered for its extension
+
+        Args:
+            abs_fname: The absolute path of the file to read
+
+        Returns:
+            The text content of the file, or an empty string if there is no reader for the file
+        """
+        reader = self.get(abs_fname)
+
+        if reader is None:
+            warn(f'doctype did not match: file={abs_fname}')
+            return ''
+
+        return reader.read(abs_fname)
+
+
+def read_raw_text_file(abs_fname: str | os.PathLike) -> str:
+    """
+    Read a file as raw text
+
+    Args:
+        abs_fname: The absolute path of the file to read
+
+    Returns:
+        The text content of the file
+    """
+    with open(abs_fname, 'r') as f:
+        try:
+            raw_txt = f.read()
+        except UnicodeDecodeError as e:
+            warn(f'File {abs_fname} has invalid or wonky encoding: {str(e)}')
+            return ''
+    return raw_txt
+
+def read_pdf_file(abs_fname: str | os.PathLike) -> str:
+    """
+    Read a file as a .pdf document
+
+    Args:
+        abs_fname: The absolute path of the file to read
+
+    Returns:
+        The text content of the file
+    """
+    from pdfminer.high_level import extract_text
+    from pdfminer.pdfdocument import PDFTextExtractionNotAllowed
+    from pdfminer.psparser import PSSyntaxError
+
+    try:
+        return extract_text(abs_fname)
+    except PDFTextExtractionNotAllowed:
+        warn(f'The pdf file {abs_fname} is locked for reading')
+    except PSSyntaxError as e:
+        warn(f'The pdf file {abs_fname} has invalid or wonky encoding: {str(e)}')
+    return ''
+
+def read_docx_file(abs_fname: str | os.PathLike) -> str:
+    """
+    Read a file as a .docx document
+
+    Args:
+        abs_fname: The absolute path of the file to read
+
+    Returns:
+        The text content of the file
+    """
+    import docx
+
+    doc = docx.Document(abs_fname)
+    full_text = []
+    for para in doc.paragraphs:
+        full_text.append(para.text)
+    return '\n'.join(full_text)
+
+def read_epub_file(abs_fname: str | os.PathLike) -> str:
+    """
+    Read a file as an .epub book
+
+    Args:
+        abs_fname: The absolute path of the file to read
+
+    Returns:
+        The text content of the file
+    """
+    import ebooklib
+    from ebooklib import epub
+    from bs4 import BeautifulSoup
+
+    book = epub.read_epub(abs_fname)
+    content = ''
+    for item in book.get_items():
+        if item.get_type() == ebooklib.ITEM_DOCUMENT:
+            body_content = item.get_body_content().decode()
+            content += BeautifulSoup(body_content).get_text().strip()
+
+    return content
+
+
+TEXT_READER = DocumentReader(
+    name='text',
+    extensions=('md', 'txt'),
+    cost='cheap',
+    version='1',
+    target='que.readers:read_raw_text_file',
+)
+
+PDF_READER = DocumentReader(
+    name='pdf',
+    extensions=('pdf',),
+    cost='expensive',
+    version='1',
+    target='que.readers:read_pdf_file',
+)
+
+DOCX_READER = DocumentReader(
+    name='docx',
+    extensions=('docx',),
+    cost='moderate',
+    version='1',
+    target='que.readers:read_docx_file',
+)
+
+EPUB_READER = DocumentReader(
+    name='epub',
+    extensions=('epub',),
+    cost='moderate',
+    version='1',
+    target='que.readers:read_epub_file',
+)
+
+READERS = ReaderRegistry(
+    builtin_readers=[TEXT_READER, PDF_READER, DOCX_READER, EPUB_READER]
+)
@@ -0,0 +1,215 @@
+from typing import Any, Dict, List, Tuple
+from warnings import warn
+import json
+import os
+import numpy as np
+from que.store import DirectoryStore
+
+SNAPSHOT_FORMAT_VERSION = 2
+
+def pack_strings(strings: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pack strings into a single UTF-8 buffer. Unlike a numpy string array, which pads every string
+    to 4 bytes per character of the longest one, the buffer takes up the encoded size of the strings
+
+    Args:
+        strings: The strings to pack
+
+    Returns:
+        The UTF-8 buffer, and the offsets of the strings in it, with the end offset last
+    """
+
+    encoded = [ string.encode('utf-8') for string in strings ]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([ len(string) for string in encoded ], out=offsets[1:])
+
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+def unpack_strings(buffer: np.ndarray, offsets: np.ndarray) -> List[str]:
+    """
+    Args:
+        buffer: A UTF-8 buffer written by `pack_strings`
+        offsets: The offsets of the strings in `buffer`
+
+    Returns:
+        The packed strings
+    """
+
+    data = buffer.tobytes()
+    return [ data[start:end].decode('utf-8') for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist()) ]
+
+def export_snapshot(
+        db: DirectoryStore,
+        snapshot_fname: str | os.PathLike,
+        root: str | os.PathLike = '.',
+    ) -> int:
+    """
+    Write the indexed chunks under `root`, with their metadata, fingerprints and embeddings, to a `.npz` snapshot
+
+    Paths are stored relative to `root`, so that the snapshot can be imported on a different mount point
+
+    Args:
+        db: The document store
+        snapshot_fname: The path of the snapshot file to write
+
+    Kwargs:
+        root: The root directory of the exported documents. Documents outside of it are not exported
+
+    Returns:
+        The number of exported chunks
+    """
+
+    root = os.path.abspath(root)
+    entries = db.collection.get(include=['documents', 'metadatas', 'embeddings'])
+
+    ids = []
+    sources = []
+    fingerprints = []
+    content_digests = []
+    documents = []
+    embeddings = []
+
+    for doc_id, document, meta, embedding in zip(entries['ids'], entries['documents'], entries['metadatas'], entries['embeddings']):
+
+        abs_fname = meta['source']
+        if os.path.commonpath([root, abs_fname]) != root:
+            continue
+
+        rel_fname = os.path.relpath(abs_fname, root)
+
+        ids.append(rel_fname + doc_id[len(abs_fname):])
+        sources.append(rel_fname)
+        fingerprints.append(meta['fingerprint'])
+        content_digests.append(meta.get('content_digest', ''))
+        documents.append(document)
+        embeddings.append(embedding)
+
+    header = {
+        'format_version': SNAPSHOT_FORMAT_VERSION,
+        'embedding_model': db.active_embedding_model,
+        'embedding_dim': len(embeddings[0]) if len(embeddings) > 0 else None,
+        'chunk_size': db.chunk_size,
+        'chunk_step': db.chunk_step,
+    }
+
+    packed_ids, ids_offsets = pack_strings(ids)
+    packed_sources, sources_offsets = pack_strings(sources)
+    packed_documents, documents_offsets = pack_strings(documents)
+
+    with open(snapshot_fname, 'wb') as f:
+        np.savez_compressed(
+            f,
+            header=np.array(json.dumps(header)),
+            ids=packed_ids,
+            ids_offsets=ids_offsets,
+            sources=packed_sources,
+            sources_offsets=sources_offsets,
+            # hex digests, fixed width
+            fingerprints=np.array(fingerprints, dtype=str),
+            content_digests=np.array(content_digests, dtype=str),
+            documents=packed_documents,
+            documents_offsets=documents_offsets,
+            embeddings=np.array(embeddings, dtype=np.float32).reshape(len(embeddings), header['embedding_dim'] or 0),
+        )
+
+    if db.v: print(f'Exported {len(ids)} text snippets from {len(set(sources))} files to {snapshot_fname}')
+    return len(ids)
+
+def read_snapshot_header(snapshot: Any) -> Dict[str, Any]:
+    """
+    Args:
+        snapshot: A loaded `.npz` snapshot
+
+    Returns:
+        The snapshot header
+    """
+
+    header = json.loads(str(snapshot['header']))
+
+    assert header['format_version'] <= SNAPSHOT_FORMAT_VERSION, f'Snapshot format version {header["format_version"]} is newer than the supported version {SNAPSHOT_FORMAT_VERSION}. Update que to import it'
+    return header
+
+def import_snapshot(
+        db: DirectoryStore,
+        snapshot_fname: str | os.PathLike,
+        root: str | os.PathLike = '.',
+        batch_size: int = 4_096,
+    ) -> int:
+    """
+    Bulk-load a `.npz` snapshot written by `export_snapshot`, using its stored embeddings. No model inference is done
+
+    Args:
+        db: The document store
+        snapshot_fname: The path of the snapshot file to read
+
+    Kwargs:
+        root: The directory the snapshot paths are relative to
+        batch_size: The number of chunks to insert per batch
+
+    Returns:
+        The number of imported chunks
+    """
+
+    root = os.path.abspath(root)
+
+    with np.load(snapshot_fname, allow_pickle=False) as snapshot:
+        header = read_snapshot_header(snapshot)
+
+        assert header['embedding_model'] == db.active_embedding_model, f'The snapshot was built with {header["embedding_model"]}, but the index uses {db.active_embedding_model}'
+        index_dim = (db.collection.metadata or {}).get('embedding_dim')
+        assert index_dim is None or header['embedding_dim'] in (None, index_dim), f'The snapshot embeddings have dimension {header["embedding_dim"]}, but the index embeddings have dimension {index_dim}'
+
+        if (header['chunk_size'], header['chunk_step']) != (db.chunk_size, db.chunk_step):
+            warn(f'The snapshot was chunked with chunk_size={header["chunk_size"]}, chunk_step={header["chunk_step"]}, but chunk_size={db.chunk_size}, chunk_step={db.chunk_step} are configured. Run `que reindex --rechunk` to rechunk it')
+
+        def read_strings(name: str) -> List[str]:
+            if header['format_version'] < 2:
+                return snapshot[name].tolist()
+            return unpack_strings(snapshot[name], snapshot[f'{name}_offsets'])
+
+        ids = [ os.path.join(root, doc_id) for doc_id in read_strings('ids') ]
+        sources = [ os.path.join(root, source) for source in read_strings('sources') ]
+        fingerprints = snapshot['fingerprints'].tolist()
+        # the file fingerprints only match on the exporting host, the content digests let unchanged files be kept
+        content_digests = snapshot['content_digests'].tolist() if 'content_digests' in snapshot.files else [''] * len(ids)
+        documents = read_strings('documents')
+        embeddings = snapshot['embeddings']
+
+    if len(ids) == 0:
+        return 0
+
+    if db.v: print(f'Importing {len(ids)} text snippets from {len(set(sources))} files...')
+
+    with db.index_lock:
+        db.sync_client()
+
+        # replace every chunk of the imported files, in case they were indexed with a different chunking
+        db.collection.delete(
+            where={
+                'source': {
+                    '$in': list(set(sources))
+                }
+            }
+        )
+        db.lexical.delete_sources(list(set(sources)))
+
+        for i in range(0, len(ids), batch_size):
+            db.collection.upsert(
+                ids=ids[i : i + batch_size],
+                documents=documents[i : i + batch_size],
+                embeddings=embeddings[i : i + batch_size].tolist(),
+                metadatas=[
+                    {
+                        'source': source,
+                        'fingerprint': fingerprint,
+                        **({ 'content_digest': content_digest } if content_digest != '' else {}),
+                    }
+                    for source, fingerprint, content_digest in zip(sources[i : i + batch_size], fingerprints[i : i + batch_size], content_digests[i : i + batch_size])
+                ]
+            )
+            db.lexical.upsert(ids[i : i + batch_size], documents[i : i + batch_size], [ { 'source': source } for source in sources[i : i + batch_size] ])
+
+        db.update_collection_metadata(db.collection, db.collection.metadata or {})
+        db.bump_index_revision()
+
+    return len(ids)
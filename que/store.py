@@ -1,20 +1,42 @@
-from typing import List, Tuple, Dict, Callable
+from typing import List, Tuple, Dict, Callable, Any
 import chromadb
+import chromadb.errors
 import glob
 import os
-import hashlib
+import sys
+import json
+import subprocess
+from warnings import warn
 import chromadb.utils
 import chromadb.utils.embedding_functions
-import ebooklib
-from ebooklib import epub
-from bs4 import BeautifulSoup
-from pdfminer.high_level import extract_text as read_pdf_file
-from pdfminer.pdfdocument import PDFTextExtractionNotAllowed
-from pdfminer.psparser import PSSyntaxError
-from warnings import warn
-import docx
+from que.readers import READERS
+from que.cache import TextCache
+from que import fingerprints
+from que.lock import FileLock
+from que.embeddings import ShardedSentenceTransformerEmbeddingFunction
+from que.lexical import LexicalIndex, reciprocal_rank_fusion
 import torch
 
+INDEX_STATE_FNAME = 'index_state.json'
+DEFAULT_INDEX_STATE = {
+    'active': 'tomes',
+    'building': None,
+    'retired': [],
+    # bumped on every write to the index
+    'revision': 0,
+}
+
+# chromadb shares one client system per index path within a process, and caches the vector index in memory, where the
+# writes of other processes are not seen. These record the index revision the system of this process was last in sync
+# with, and how many times it was restarted to catch up, per index path
+SYNCED_REVISIONS: Dict[str, int] = {}
+CLIENT_RESTARTS: Dict[str, int] = {}
+
+# raised by chromadb for a missing collection, depending on its version
+MISSING_COLLECTION_ERRORS = (ValueError, chromadb.errors.ChromaError)
+
+QUERY_MODES = ('vector', 'lexical', 'hybrid')
+
 class DirectoryStore:
 
 
@@ -24,28 +46,493 @@ class DirectoryStore:
             chunk_step: int,
             st_embedding_model: str,
             is_verbose: bool = False,
+            text_cache_max_size_mb: int = 512,
+            refresh: bool = True,
+            background_migration: bool = False,
+            read_only: bool = False,
+            refresh_lock_timeout: float | None = 30,
+            embedding_workers: int = 0,
+            embedding_batch_size: int = 32,
         ) -> None:
         
         self.config_folder =  os.path.expanduser('~') + '/.config/que'
         self.findex_name = f'{self.config_folder}/index.chroma'
+        self.text_cache = TextCache(
+            f'{self.config_folder}/text_cache',
+            max_size_bytes=text_cache_max_size_mb * 1024 * 1024,
+            read_only=read_only
+        )
 
         self.v = is_verbose
 
         self.chunk_step = chunk_step
         self.chunk_size = chunk_size
         self.embedding_model = st_embedding_model
+        self.embedding_workers = embedding_workers
+        self.embedding_batch_size = embedding_batch_size
+
+        # serializes index mutations across processes
+        self.index_lock = FileLock(f'{self.config_folder}/index.lock')
+        self.refresh_lock_timeout = refresh_lock_timeout
+        self.read_only = read_only
+
+        if self.read_only and not os.path.exists(self.findex_name):
+            raise FileNotFoundError(f'No index found at {self.findex_name}. Run `que reindex` to build it')
+
+        self.client = self.open_client()
+
+        # queries are served by the active index generation, with the model it was built with,
+        # even if `st_embedding_model` changed. The new generation is built by `migrate`
+        active_metadata = self.open_active_generation()
+
+        self.lexical = LexicalIndex(f'{self.config_folder}/lexical.sqlite', read_only=self.read_only)
+
+        if self.read_only:
+            return
+
+        self.collect_retired_generations()
+
+        if self.lexical.count() != self.collection.count():
+            if self.v: print('Rebuilding lexical index...')
+            self.rebuild_lexical_index()
+
+        self.update_collection_metadata(self.collection, active_metadata)
+
+        if self.active_embedding_model != self.embedding_model and background_migration:
+            if self.v: print(f'Index was built with {self.active_embedding_model}, but {self.embedding_model} is configured. Building new index generation in the background')
+            self.start_background_migration()
+
+        if refresh:
+            self.refresh()
+
+    def open_client(self) -> chromadb.ClientAPI:
+        """
+        Returns:
+            A client of the DB, sharing the client system of this process
+        """
+
+        if self.findex_name not in SYNCED_REVISIONS:
+            # read before the system is started, so that writes made while starting are caught by `sync_client`
+            SYNCED_REVISIONS[self.findex_name] = self.load_index_state()['revision']
+        self.client_restarts = CLIENT_RESTARTS.get(self.findex_name, 0)
+
+        return chromadb.PersistentClient(path=self.findex_name)
+
+    def sync_client(self):
+        """
+        Restart the DB client system of this process if another process wrote to the index since it was last in sync,
+        then reopen the active index generation. Writing through a stale client would overwrite the writes of the other process
+
+        Call while holding `index_lock`, before reading the index to update it
+        """
+
+        revision = self.load_index_state()['revision']
+        if SYNCED_REVISIONS[self.findex_name] != revision:
+            if self.v: print('The index was updated by another process. Reopening it')
+            # stores of this process holding the old client reopen it on their next `reload_active_generation`
+            self.client.clear_system_cache()
+            CLIENT_RESTARTS[self.findex_name] = CLIENT_RESTARTS.get(self.findex_name, 0) + 1
+            SYNCED_REVISIONS[self.findex_name] = revision
+
+        self.reload_active_generation()
+
+    def bump_index_revision(self):
+        """
+        Record a write to the index, so that other processes reopen it before updating it
+
+        Call while holding `index_lock`, after writing to the index
+        """
+
+        index_state = self.load_index_state()
+        revision = index_state['revision'] + 1
+        self.save_index_state({ **index_state, 'revision': revision })
+        SYNCED_REVISIONS[self.findex_name] = revision
+
+    def make_embedding_function(
+        self,
+        st_embedding_model: str
+        ) -> ShardedSentenceTransformerEmbeddingFunction:
+        """
+        Args:
+            st_embedding_model: A sentence-transformers model name
+
+        Returns:
+            The embedding function for the model, on the fastest available device.
+            On CPU, batches are sharded across `embedding_workers` processes
+        """
 
         device = 'cuda' if torch.cuda.is_available() else (
             'mps' if torch.backends.mps.is_available() else 'cpu'
         )
-        self.collection = chromadb.PersistentClient(path=self.findex_name).get_or_create_collection(
-            name='tomes',
-            embedding_function=chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction(
-                model_name=self.embedding_model,
-                device=device
-            )
+        return ShardedSentenceTransformerEmbeddingFunction(
+            model_name=st_embedding_model,
+            device=device,
+            workers=self.embedding_workers if device == 'cpu' else 0,
+            batch_size=self.embedding_batch_size,
+        )
+
+    def generation_lock(self, generation: str, shared: bool = True) -> FileLock:
+        """
+        Args:
+            generation: The name of an index generation collection
+
+        Kwargs:
+            shared: Get the lock held by readers of the generation. The exclusive lock is only acquired to delete it
+
+        Returns:
+            The lock of the generation
+        """
+        return FileLock(f'{self.config_folder}/generation-{generation}.lock', shared=shared, read_only=self.read_only)
+
+    def open_active_generation(self) -> Dict[str, Any]:
+        """
+        Open the active index generation, and hold its shared lock so that it is not deleted while in use
+
+        Returns:
+            The metadata of the active generation
+        """
+
+        get_collection = self.client.get_collection if self.read_only else self.client.get_or_create_collection
+
+        while True:
+            index_state = self.load_index_state()
+            generation_lock = self.generation_lock(index_state['active'])
+            is_locked = generation_lock.try_acquire()
+
+            # the generations may have been swapped before the lock was acquired
+            if self.load_index_state()['active'] == index_state['active']:
+                break
+            generation_lock.release()
+
+        if not is_locked and self.read_only:
+            # e.g. on a read only config folder. Reading still works, but the generation is not protected
+            warn(f'Could not lock index generation {index_state["active"]}. A migration finishing while it is read may delete it')
+        elif not is_locked and self.v:
+            print(f'Index generation {index_state["active"]} is locked by another process')
+
+        self.active_generation = index_state['active']
+        self.held_generation_lock = generation_lock
+
+        try:
+            active_metadata = get_collection(
+                name=self.active_generation,
+                embedding_function=None
+            ).metadata or {}
+        except MISSING_COLLECTION_ERRORS as e:
+            # only a read only store does not create the collection
+            raise FileNotFoundError(f'No index found at {self.findex_name}. Run `que reindex` to build it') from e
+
+        if 'embedding_model' not in active_metadata:
+            # index built before models were recorded, assume it was built with the configured model
+            active_metadata = { **active_metadata, 'embedding_model': self.embedding_model, 'generation': 0 }
+        self.active_embedding_model = active_metadata['embedding_model']
+
+        self.collection = get_collection(
+            name=self.active_generation,
+            embedding_function=self.make_embedding_function(self.active_embedding_model)
+        )
+
+        return active_metadata
+
+    def reload_active_generation(self) -> bool:
+        """
+        Switch to the active index generation, if a new generation was made active since the store was opened.
+        Also reopens it if the DB client system of this process was restarted by `sync_client`
+
+        Returns:
+            `True` if the store switched generations
+        """
+
+        if not self.needs_reload():
+            return False
+
+        if self.client_restarts != CLIENT_RESTARTS.get(self.findex_name, 0):
+            self.client = self.open_client()
+
+        active_generation = self.active_generation
+        self.held_generation_lock.release()
+        self.open_active_generation()
+        return self.active_generation != active_generation
+
+    def needs_reload(self) -> bool:
+        """
+        Returns:
+            `True` if `reload_active_generation` would reopen the active index generation
+        """
+        return self.client_restarts != CLIENT_RESTARTS.get(self.findex_name, 0) or self.load_index_state()['active'] != self.active_generation
+
+    def collect_retired_generations(self):
+        """
+        Delete the retired index generations that no process is reading anymore.
+        Skipped if another process is updating the DB, they will be collected on a later run
+        """
+
+        if len(self.load_index_state()['retired']) == 0 or not self.index_lock.try_acquire():
+            return
+
+        try:
+            index_state = self.load_index_state()
+            still_retired = []
+
+            for generation in index_state['retired']:
+                generation_lock = self.generation_lock(generation, shared=False)
+                if not generation_lock.try_acquire():
+                    # still open by another process
+                    still_retired.append(generation)
+                    continue
+
+                try:
+                    self.client.delete_collection(generation)
+                except MISSING_COLLECTION_ERRORS:
+                    pass
+                finally:
+                    generation_lock.release()
+                os.remove(generation_lock.lock_fname)
+
+                if self.v: print(f'Deleted retired index generation {generation}')
+
+            if still_retired != index_state['retired']:
+                self.save_index_state({ **index_state, 'retired': still_retired })
+        finally:
+            self.index_lock.release()
+
+    @staticmethod
+    def update_collection_metadata(collection: chromadb.Collection, metadata: Dict[str, Any]):
+        """
+        Record the embedding model, embedding dimension and generation of an index collection
+
+        Args:
+            collection: The index collection
+            metadata: The collection metadata. The embedding dimension is filled in once the collection holds embeddings
+        """
+
+        metadata = { k: v for k, v in metadata.items() if not k.startswith('hnsw:') }
+
+        if 'embedding_dim' not in metadata and collection.count() > 0:
+            embeddings = collection.get(limit=1, include=['embeddings'])['embeddings']
+            metadata['embedding_dim'] = len(embeddings[0])
+
+        current_metadata = { k: v for k, v in (collection.metadata or {}).items() if not k.startswith('hnsw:') }
+        if metadata != current_metadata:
+            collection.modify(metadata=metadata)
+
+    def load_index_state(self) -> Dict[str, Any]:
+        """
+        Returns:
+            The index state, holding the name of the active collection and of the collection being built, if any
+        """
+
+        try:
+            with open(f'{self.config_folder}/{INDEX_STATE_FNAME}', 'r') as f:
+                return { **DEFAULT_INDEX_STATE, **json.load(f) }
+        except FileNotFoundError:
+            return dict(DEFAULT_INDEX_STATE)
+
+    def save_index_state(self, index_state: Dict[str, Any]):
+        """
+        Atomically replace the index state
+
+        Args:
+            index_state: The new index state
+        """
+
+        state_fname = f'{self.config_folder}/{INDEX_STATE_FNAME}'
+        tmp_fname = f'{state_fname}.{os.getpid()}.tmp'
+        with open(tmp_fname, 'w') as f:
+            json.dump(index_state, f)
+        os.replace(tmp_fname, state_fname)
+
+    def start_background_migration(self):
+        """
+        Start `que migrate` as a detached process, unless a migration is already running
+        """
+
+        migration_lock = FileLock(f'{self.config_folder}/migrate.lock')
+        if not migration_lock.try_acquire():
+            if self.v: print('Index migration already in progress')
+            return
+        migration_lock.release()
+
+        subprocess.Popen(
+            [sys.executable, '-m', 'que.cli', 'migrate'],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
         )
 
+    def migrate(self, batch_size: int = 256) -> bool:
+        """
+        Build a new index generation with the configured embedding model, then make it the active generation
+
+        The new generation is built incrementally from the chunks stored in the active generation, without reading the files again.
+        Progress is kept across runs, and chunks that are added or changed in the active generation while building are carried over
+
+        Kwargs:
+            batch_size: The number of chunks to embed per batch
+
+        Returns:
+            `True` if the new generation is now active, `False` if there was nothing to migrate or another migration is running
+        """
+
+        assert not self.read_only, 'The store was opened as read only'
+
+        migration_lock = FileLock(f'{self.config_folder}/migrate.lock')
+        if not migration_lock.try_acquire():
+            if self.v: print('Index migration already in progress')
+            return False
+
+        try:
+            self.reload_active_generation()
+            self.collect_retired_generations()
+            index_state = self.load_index_state()
+
+            if self.active_embedding_model == self.embedding_model:
+                if index_state['building'] is not None:
+                    # the configured model was switched back before the migration was completed
+                    self.client.delete_collection(index_state['building'])
+                    self.save_index_state({ **index_state, 'building': None })
+                return False
+
+            generation = (self.collection.metadata or {}).get('generation', 0) + 1
+            target_metadata = {
+                'embedding_model': self.embedding_model,
+                'generation': generation,
+            }
+
+            if index_state['building'] is not None:
+                building = self.client.get_or_create_collection(name=index_state['building'], embedding_function=None)
+                if (building.metadata or {}).get('embedding_model') != self.embedding_model:
+                    # built for a model that is no longer configured
+                    self.client.delete_collection(index_state['building'])
+                    index_state['building'] = None
+
+            if index_state['building'] is None:
+                index_state['building'] = f'tomes-g{generation}'
+                self.save_index_state(index_state)
+
+            target = self.client.get_or_create_collection(
+                name=index_state['building'],
+                embedding_function=self.make_embedding_function(self.embedding_model),
+                metadata=target_metadata
+            )
+
+            while self.copy_pending_chunks(target, batch_size) > 0:
+                pass
+
+            with self.index_lock:
+                self.sync_client()
+                target = self.client.get_collection(
+                    name=index_state['building'],
+                    embedding_function=self.make_embedding_function(self.embedding_model)
+                )
+
+                # catch up with chunks written while building, then swap generations
+                while self.copy_pending_chunks(target, batch_size) > 0:
+                    pass
+
+                self.update_collection_metadata(target, target_metadata)
+
+                # other processes may still be reading the old generation, it is deleted once they are done with it
+                index_state = self.load_index_state()
+                self.save_index_state({
+                    **index_state,
+                    'active': index_state['building'],
+                    'building': None,
+                    'retired': index_state['retired'] + [index_state['active']],
+                })
+                self.bump_index_revision()
+                self.reload_active_generation()
+
+            if self.v: print(f'Index generation {generation} built with {self.embedding_model} is now active')
+
+            return True
+        finally:
+            migration_lock.release()
+
+    def copy_pending_chunks(self, target: chromadb.Collection, batch_size: int) -> int:
+        """
+        Copy the chunks of the active generation that are missing or outdated in `target`, and delete the chunks of `target`
+        that are no longer in the active generation
+
+        Args:
+            target: The collection of the generation being built
+            batch_size: The number of chunks to embed per batch
+
+        Returns:
+            The number of copied chunks
+        """
+
+        def chunk_versions(collection: chromadb.Collection) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+            entries = collection.get(include=['documents', 'metadatas'])
+            return {
+                doc_id: (document, meta)
+                for doc_id, document, meta in zip(entries['ids'], entries['documents'], entries['metadatas'])
+            }
+
+        active_versions = chunk_versions(self.collection)
+        target_versions = chunk_versions(target)
+
+        stale_ids = [ doc_id for doc_id in target_versions if doc_id not in active_versions ]
+        pending_ids = [ doc_id for doc_id, (document, _) in active_versions.items() if doc_id not in target_versions or target_versions[doc_id][0] != document ]
+        pending_ids_set = set(pending_ids)
+        # same text, so the embedding is still valid. Only the fingerprints need updating
+        meta_changed_ids = [ doc_id for doc_id, version in active_versions.items() if doc_id not in pending_ids_set and target_versions[doc_id] != version ]
+
+        if len(stale_ids) > 0:
+            target.delete(ids=stale_ids)
+
+        if len(meta_changed_ids) > 0:
+            target.update(
+                ids=meta_changed_ids,
+                metadatas=[ active_versions[doc_id][1] for doc_id in meta_changed_ids ]
+            )
+
+        if len(pending_ids) > 0 and self.v: print(f'Embedding {len(pending_ids)} text snippets with {self.embedding_model}. This might take a while...')
+        for i in range(0, len(pending_ids), batch_size):
+            batch = self.collection.get(ids=pending_ids[i : i + batch_size], include=['documents', 'metadatas'])
+            target.upsert(
+                ids=batch['ids'],
+                documents=batch['documents'],
+                metadatas=batch['metadatas']
+            )
+
+        return len(pending_ids)
+
+    def refresh(self) -> bool:
+        """
+        Index the documents in the current directory and update the DB to the current state of the file system
+
+        If another process is updating the DB, wait for it for up to `refresh_lock_timeout` seconds, then skip the refresh
+
+        Returns:
+            `True` if the DB was refreshed, `False` if it was skipped
+        """
+
+        assert not self.read_only, 'The store was opened as read only'
+
+        if not self.index_lock.acquire(timeout=self.refresh_lock_timeout):
+            if self.v: print('The index is being updated by another process. Skipping refresh')
+            return False
+
+        try:
+            self.refresh_locked()
+        finally:
+            self.index_lock.release()
+
+        return True
+
+    def refresh_locked(self):
+        """
+        Same as `refresh`, for callers already holding `index_lock`
+        """
+
+        # another process may have written to the index, or swapped index generations, while waiting for the lock
+        active_generation = self.active_generation
+        self.sync_client()
+        if self.active_generation != active_generation and self.v:
+            print('The index was migrated by another process. Switched to the new index generation')
+
         # update with new data
         if self.v: print('Updating fmap db with current directory...')
         fmap_in_current_dir = self.explore_current_dir()
@@ -71,33 +558,63 @@ class DirectoryStore:
         file_no_longer_exists_fnames = []
         fingerprint_changed_fnames = []
         fingerprint_changed_fprints = []
+        fingerprint_changed_digests = []
+        content_unchanged_fnames = []
+        content_unchanged_fprints = []
+        checked_fnames = set()
 
 
         for doc_meta in metadatas:
 
             abs_fname = doc_meta['source']
 
-            if abs_fname in file_no_longer_exists_fnames or abs_fname in fingerprint_changed_fnames:
+            if abs_fname in checked_fnames:
                 # already processed
                 continue
+            checked_fnames.add(abs_fname)
 
 
-            if os.path.exists(abs_fname):
-                current_fingerprint = self.get_file_fingerprint(abs_fname, self.embedding_model)
-                stored_fingerprint = doc_meta['fingerprint']
+            status, current_fingerprint, current_digest = fingerprints.check_file(abs_fname, doc_meta['fingerprint'], doc_meta.get('content_digest'))
+
+            if status == fingerprints.FILE_UNCHANGED:
+                continue
 
-                if current_fingerprint != stored_fingerprint:
-                    if self.v: 
-                        print(f'\tFile fingerprint changed: {abs_fname}')
-                        print(f'\t\tExpected fprint {stored_fingerprint}. Got {current_fingerprint}')
-                    fingerprint_changed_fnames.append(abs_fname)
-                    fingerprint_changed_fprints.append(current_fingerprint)
+            if status == fingerprints.FILE_TOUCHED:
+                if self.v: print(f'\tFile fingerprint changed, but contents did not: {abs_fname}')
+                content_unchanged_fnames.append(abs_fname)
+                content_unchanged_fprints.append(current_fingerprint)
 
+            elif status == fingerprints.FILE_CHANGED:
+                if self.v: 
+                    print(f'\tFile fingerprint changed: {abs_fname}')
+                    print(f'\t\tExpected fprint {doc_meta["fingerprint"]}. Got {current_fingerprint}')
+                fingerprint_changed_fnames.append(abs_fname)
+                fingerprint_changed_fprints.append(current_fingerprint)
+                fingerprint_changed_digests.append(current_digest)
 
             else:
                 if self.v: print(f'\tFile no longer exists: {abs_fname}')
                 file_no_longer_exists_fnames.append(abs_fname)
 
+        # 0. Record the new fingerprint of files whose contents did not change, so that the next run only needs the 1st tier
+        if len(content_unchanged_fnames) > 0:
+            new_fprints = dict(zip(content_unchanged_fnames, content_unchanged_fprints))
+            unchanged_entries = self.collection.get(
+                where={
+                    'source': {
+                        '$in': content_unchanged_fnames
+                    }
+                },
+                include=['metadatas']
+            )
+            self.collection.update(
+                ids=unchanged_entries['ids'],
+                metadatas=[
+                    { **meta, 'fingerprint': new_fprints[meta['source']] }
+                    for meta in unchanged_entries['metadatas']
+                ]
+            )
+
         # 1. Purge non existent entries - Delete if the file does not exist
         #    Also delete fprint changed. Instead of an upsert which may leave chunks that have
         #     been removed from the document
@@ -112,6 +629,7 @@ class DirectoryStore:
                     }
                 }
             )
+            self.lexical.delete_sources(deletes)
 
 
         # 2. Update if the file exists but the fingerprint changed
@@ -119,9 +637,9 @@ class DirectoryStore:
         documents = []
         metadatas = []
 
-        for abs_fname, fingerprint in zip(fingerprint_changed_fnames, fingerprint_changed_fprints):
+        for abs_fname, fingerprint, content_digest in zip(fingerprint_changed_fnames, fingerprint_changed_fprints, fingerprint_changed_digests):
             
-            entries_or_err = self.try_prepare_entry(abs_fname, fingerprint=fingerprint)
+            entries_or_err = self.try_prepare_entry(abs_fname, fingerprint=fingerprint, content_digest=content_digest)
 
             if entries_or_err == False:
                 continue
@@ -141,10 +659,13 @@ class DirectoryStore:
         
 
 
+        fingerprint_changed_fnames = set(fingerprint_changed_fnames)
         new_files = set(filter(
             lambda fname: fname not in indexed_files and not fname in fingerprint_changed_fnames,
             files_in_dir
         ))
+        # read cheap documents first
+        new_files = sorted(new_files, key=READERS.cost_rank)
 
         for abs_fname in new_files:
             entries_or_err = self.try_prepare_entry(abs_fname)
@@ -168,6 +689,11 @@ class DirectoryStore:
                 documents=documents,
                 metadatas=metadatas
             )
+            self.lexical.upsert(ids, documents, metadatas)
+            self.update_collection_metadata(self.collection, self.collection.metadata or {})
+
+        if len(content_unchanged_fnames) > 0 or len(deletes) > 0 or len(ids) > 0:
+            self.bump_index_revision()
 
 
 
@@ -184,11 +710,8 @@ class DirectoryStore:
         fmap = []
 
         files = [
-            glob.iglob('**/*.md', recursive=recursive) ,
-            glob.iglob('**/*.txt', recursive=recursive),
-            glob.iglob('**/*.pdf', recursive=recursive),
-            glob.iglob('**/*.docx', recursive=recursive),
-            glob.iglob('**/*.epub', recursive=recursive),
+            glob.iglob(f'**/*.{ext}', recursive=recursive)
+            for ext in READERS.extensions()
         ]
         
         if self.v: print(f'Exploring directory {os.path.abspath(".")}')
@@ -204,6 +727,7 @@ class DirectoryStore:
         self,
           abs_fname: str | os.PathLike, 
           fingerprint: str | None = None,
+          content_digest: str | None = None,
         ) -> bool | Tuple[List[str], List[Dict[str, str]], List[str]]:
         """
         Prepare a file to insert in the DB store
@@ -213,23 +737,49 @@ class DirectoryStore:
 
         Kwargs:
             fingerprint: If previously computed, bypass obtaining the fingerprint and use `fingerprint` instead
+            content_digest: If previously computed, bypass hashing the file and use `content_digest` instead
 
         Returns:
             A tuple of the form `ids, metadatas, documents` containing an entry for every document chunk in the file or `False` if the file was empty or could not be read
         """
 
-        txt = read_file(abs_fname).strip()
+        if fingerprint is None: fingerprint = self.get_file_fingerprint(abs_fname, self.embedding_model)
+        if content_digest is None: content_digest = self.get_content_digest(abs_fname)
+
+        txt = self.read_file_cached(abs_fname, content_digest).strip()
         if txt == '': return False
 
+        return self.prepare_entry_from_text(abs_fname, fingerprint, content_digest, txt)
+
+    def prepare_entry_from_text(
+        self,
+        abs_fname: str | os.PathLike,
+        fingerprint: str,
+        content_digest: str,
+        txt: str,
+        ) -> Tuple[List[str], List[Dict[str, str]], List[str]]:
+        """
+        Chunk the text of a file to insert in the DB store
+
+        Args:
+            abs_fname: The absolute name of the file to insert
+            fingerprint: The fingerprint of the file
+            content_digest: The digest of the file contents
+            txt: The text content of the file
+
+        Returns:
+            A tuple of the form `ids, metadatas, documents` containing an entry for every document chunk in the file
+        """
+
         txt_chunks = self.chunkify(txt)
 
         ids = [ f'{abs_fname}-chk-{i}' for i in range(len(txt_chunks))]
 
-        if fingerprint is None: fingerprint = self.get_file_fingerprint(abs_fname, self.embedding_model)
         metadatas = [ 
             {
                 'source': abs_fname,
                 'fingerprint': fingerprint,
+                'content_digest': content_digest,
             } 
         ] * len(txt_chunks)
         
@@ -238,6 +788,126 @@ class DirectoryStore:
         return ids, metadatas, documents
 
 
+    def read_file_cached(
+        self,
+        abs_fname: str | os.PathLike,
+        content_digest: str,
+        ) -> str:
+        """
+        Read a file, using the extracted text cache if the same file contents were read before
+
+        Args:
+            abs_fname: The absolute name of the file to read
+            content_digest: The digest of the file contents
+
+        Returns:
+            The text content of the file
+        """
+
+        reader = READERS.get(abs_fname)
+        if reader is None:
+            return read_file(abs_fname)
+
+        txt = self.text_cache.get(abs_fname, content_digest, reader.version)
+        if txt is not None:
+            if self.v: print(f'\tRead from text cache: {abs_fname}')
+            return txt
+
+        txt = reader.read(abs_fname)
+        if txt.strip() != '':
+            self.text_cache.put(abs_fname, content_digest, reader.version, txt)
+
+        return txt
+
+    def rechunk(self):
+        """
+        Rebuild the chunks and embeddings of every indexed file, using the current `chunk_size` and `chunk_step`
+
+        The text of the files is taken from the extracted text cache. Files that are not in the cache are read again.
+        Files that were only touched are rechunked with their new fingerprint. Files that no longer exist or whose contents
+        changed since they were indexed are left for `db_update_to_current_files`
+        """
+
+        assert not self.read_only, 'The store was opened as read only'
+
+        with self.index_lock:
+            self.sync_client()
+            self.rechunk_locked()
+
+    def rechunk_locked(self):
+        """
+        Same as `rechunk`, for callers already holding `index_lock`
+        """
+
+        metadatas = self.collection.get(include=['metadatas'])['metadatas']
+        stored_metas = { meta['source']: meta for meta in metadatas }
+
+        if self.v: print(f'Rechunking {len(stored_metas)} files...')
+
+        sources = []
+        ids = []
+        documents = []
+        metadatas = []
+
+        for abs_fname, meta in stored_metas.items():
+
+            status, fingerprint, content_digest = fingerprints.check_file(abs_fname, meta['fingerprint'], meta.get('content_digest'))
+            if status in (fingerprints.FILE_CHANGED, fingerprints.FILE_DELETED):
+                if self.v: print(f'\tSkipping altered/deleted file: {abs_fname}')
+                continue
+
+            # indexes built before content digests were recorded lack them
+            if content_digest is None: content_digest = fingerprints.get_content_digest(abs_fname)
+
+            txt = self.read_file_cached(abs_fname, content_digest).strip()
+            if txt == '':
+                continue
+
+            file_doc_ids, file_metadatas, file_txt_chunks = self.prepare_entry_from_text(abs_fname, fingerprint, content_digest, txt)
+
+            sources.append(abs_fname)
+            ids += file_doc_ids
+            metadatas += file_metadatas
+            documents += file_txt_chunks
+
+        if len(sources) == 0:
+            return
+
+        self.collection.delete(
+            where={
+                'source': {
+                    '$in': sources
+                }
+            }
+        )
+        self.lexical.delete_sources(sources)
+
+        if self.v or len(ids) > 1_000: print(f'\nAdding {len(ids)} text snippets to DB. This might take a while...')
+        self.collection.upsert(
+            ids=ids,
+            documents=documents,
+            metadatas=metadatas
+        )
+        self.lexical.upsert(ids, documents, metadatas)
+        self.update_collection_metadata(self.collection, self.collection.metadata or {})
+        self.bump_index_revision()
+
+    def rebuild_lexical_index(self):
+        """
+        Rebuild the lexical index from the chunks in the DB, without any embedding model.
+        Skipped if another process is updating the DB, it will be rebuilt on a later run
+        """
+
+        if not self.index_lock.try_acquire():
+            return
+
+        try:
+            self.sync_client()
+            entries = self.collection.get(include=['documents', 'metadatas'])
+            self.lexical.rebuild(entries['ids'], entries['documents'], entries['metadatas'])
+        finally:
+            self.index_lock.release()
+
     def chunkify(
         self,
         document_txt: str, 
@@ -272,7 +942,8 @@ class DirectoryStore:
         self,
         query_txt: str,
         k: int,
-        dir_scope: str = None
+        dir_scope: str = None,
+        mode: str = 'vector',
         ) -> str | Dict:
         """
         Query the DB for related documents to the query
@@ -283,12 +954,51 @@ class DirectoryStore:
 
         Kwargs: 
             dir_scope: Restrict the query to documents within the `dir_scope` folder.
+            mode: One of `QUERY_MODES`. `vector` ranks documents by embedding similarity, `lexical` by BM25 keyword match,
+                  without loading the embedding model, and `hybrid` fuses both rankings
         Returns:
             Raw DB query results
         """
+        assert mode in QUERY_MODES, f'Query mode {mode} is not one of {QUERY_MODES}'
+
+        # long-lived stores follow migrations made by other processes, and stop holding the old generation
+        self.reload_active_generation()
+
+        return self.query_open_generation(query_txt, k, dir_scope=dir_scope, mode=mode)
+
+    def query_open_generation(
+        self,
+        query_txt: str,
+        k: int,
+        dir_scope: str = None,
+        mode: str = 'vector',
+        ) -> str | Dict:
+        """
+        Same as `query`, without switching to a newly active index generation. Does not modify the store,
+        so it can run concurrently with other queries
+        """
+        assert mode in QUERY_MODES, f'Query mode {mode} is not one of {QUERY_MODES}'
+
         if self.v:
             print(f'Querying DB with {self.collection.count()} text snippets...')
 
+        if mode == 'lexical':
+            return self.lexical.query(
+                query_txt,
+                k,
+                dir_scope=os.path.abspath(dir_scope) if dir_scope is not None else None
+            )
+
+        if mode == 'hybrid':
+            # rank twice as many candidates with each method, so that chunks ranked well by both make it to the top `k`
+            return reciprocal_rank_fusion(
+                [
+                    self.query_open_generation(query_txt, 2 * k, dir_scope=dir_scope, mode='vector'),
+                    self.query_open_generation(query_txt, 2 * k, dir_scope=dir_scope, mode='lexical'),
+                ],
+                k
+            )
+
         if dir_scope is not None:
             dir_scope = os.path.abspath(dir_scope)
             if self.v: print(f'Scoped search enabled: restricting to {dir_scope}')
@@ -353,76 +1063,32 @@ class DirectoryStore:
             abs_fname: The absolute path of the file to fingerprint
 
         Kwargs:
-            hard_digest: Hash the file instead of the file metadata
+            hard_digest: Hash the file instead of the file metadata. See `get_content_digest`
         
         Returns:
             The file fingerprint
         """
 
         if hard_digest:
-            with open(abs_fname, 'rb') as f:
-                f_info = f.read()
-        else:
-            fstat = os.stat(abs_fname)
-
-            f_info = f'{abs_fname}<//>{fstat.st_size}-{fstat.st_mtime}-{fstat.st_ctime}'.encode('utf-8')
-        
-        return hashlib.md5(f_info).hexdigest()
-
-        
-def read_file(abs_fname: str | os.PathLike) -> str:
-    """
-    Read a file using an aprorpiate file reader
+            return fingerprints.get_content_digest(abs_fname)
 
-    Args:
-        abs_fname: The absolute path of the file to read
+        return fingerprints.get_file_fingerprint(abs_fname)
 
-    Returns:
-        The text content of the file
-    """
-
-    doctype = abs_fname[ abs_fname.rfind('.')+1: ]
-
-    # FIXME: Make some sort of supported decoder API that has the types of files accepted, their decoder, etc
-    if doctype in ['txt', 'md']:
-        return read_raw_text_file(abs_fname)
-    elif doctype == 'pdf':
-        try:
-            return read_pdf_file(abs_fname)
-        except PDFTextExtractionNotAllowed:
-            warn(f'The pdf file {abs_fname} is locked for reading')
-        except PSSyntaxError as e:
-            warn(f'The pdf file {abs_fname} has invalid or wonky encoding: {str(e)}')
-    elif doctype == 'docx':
-        return read_docx_file(abs_fname)
-    elif doctype == 'epub':
-        return read_epub_file(abs_fname)
-    else:
-        warn(f'doctype did not match: doctype={doctype}')
-    return ''
-    
-    
-def read_raw_text_file(abs_fname: str | os.PathLike) -> str:
-    """
-    Read a file as raw text
+    @staticmethod
+    def get_content_digest(
+        abs_fname: str | os.PathLike,
+        block_size: int = 1 << 20,
+        ) -> str:
+        """
+        Calculate a digest of the file contents. See `que.fingerprints.get_content_digest`
+        """
 
-    Args:
-        abs_fname: The absolute path of the file to read
+        return fingerprints.get_content_digest(abs_fname, block_size=block_size)
 
-    Returns:
-        The text content of the file
-    """
-    with open(abs_fname, 'r') as f:
-        try:
-            raw_txt = f.read()
-        except UnicodeDecodeError as e:
-            warn(f'File {abs_fname} has invalid or wonky encoding: {str(e)}')
-            return ''
-    return raw_txt
 
-def read_docx_file(abs_fname: str | os.PathLike) -> str:
+def read_file(abs_fname: str | os.PathLike) -> str:
     """
-    Read a file as a .docx document
+    Read a file using the reader registered for its extension
 
     Args:
         abs_fname: The absolute path of the file to read
@@ -430,20 +1096,5 @@ def read_docx_file(abs_fname: str | os.PathLike) -> str:
     Returns:
         The text content of the file
     """
-    doc = docx.Document(abs_fname)
-    full_text = []
-    for para in doc.paragraphs:
-        full_text.append(para.text)
-    return '\n'.join(full_text)
-
-def read_epub_file(abs_fname: str | os.PathLike) -> str:
-
-
-    book = epub.read_epub(abs_fname)
-    content = ''
-    for item in book.get_items():
-        if item.get_type() == ebooklib.ITEM_DOCUMENT:
-            body_content = item.get_body_content().decode()
-            content += BeautifulSoup(body_content).get_text().strip()
 
-    return content
\ No newline at end of file
+    return READERS.read(abs_fname)
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# importing `que.config` writes the user configuration, keep it out of the real home folder
+os.environ['HOME'] = tempfile.mkdtemp(prefix='que-test-home-')
@@ -0,0 +1,191 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from que.aio import AsyncDirectoryStore, AsyncLlm, answer, run_in_executor
+from que.store import DirectoryStore
+from tests.utils import FakeLlm, StoreTestCase
+
+class TestAsyncDirectoryStore(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_docs({ 'a.txt': 'one two three four' })
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(self.executor.shutdown)
+        self.store = AsyncDirectoryStore(self.make_store(), executor=self.executor)
+
+        # refreshes wait in the executor until `proceed` is set
+        self.refresh_started = threading.Event()
+        self.proceed = threading.Event()
+        refresh_locked = DirectoryStore.refresh_locked
+
+        def blocked_refresh_locked(db):
+            self.refresh_started.set()
+            self.proceed.wait(5)
+            refresh_locked(db)
+
+        patcher = mock.patch.object(DirectoryStore, 'refresh_locked', blocked_refresh_locked)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.proceed.set)
+
+    def test_concurrent_refreshes(self):
+        self.write_docs({ 'b.txt': 'alpha beta gamma delta' })
+
+        async def run():
+            refreshes = asyncio.gather(self.store.refresh(), self.store.refresh())
+            await run_in_executor(None, self.refresh_started.wait, 5)
+            await asyncio.sleep(0.05)
+            self.proceed.set()
+            return await refreshes
+
+        self.assertEqual(asyncio.run(run()), [True, True])
+        self.assertIn(f'{self.docs_dir}/b.txt-chk-0', self.indexed_chunks(self.store.store))
+
+    def test_query_waits_for_refresh(self):
+        self.write_docs({ 'b.txt': 'alpha beta gamma delta' })
+
+        async def run():
+            refresh = asyncio.ensure_future(self.store.refresh())
+            await run_in_executor(None, self.refresh_started.wait, 5)
+
+            query = asyncio.ensure_future(self.store.query('alpha beta gamma delta', 1))
+            await asyncio.sleep(0.05)
+            self.assertFalse(query.done())
+
+            self.proceed.set()
+            return await refresh, await query
+
+        refreshed, results = asyncio.run(run())
+        self.assertTrue(refreshed)
+        self.assertEqual(results['ids'][0], [f'{self.docs_dir}/b.txt-chk-0'])
+
+    def test_concurrent_queries(self):
+        # both queries must be running at once to get past the barrier
+        barrier = threading.Barrier(2, timeout=5)
+        query_open_generation = DirectoryStore.query_open_generation
+
+        def synchronized_query(db, *args, **kwargs):
+            barrier.wait()
+            return query_open_generation(db, *args, **kwargs)
+
+        async def run():
+            return await asyncio.gather(
+                self.store.query('one two three four', 1),
+                self.store.query('one', 1, mode='lexical'),
+            )
+
+        with mock.patch.object(DirectoryStore, 'query_open_generation', synchronized_query):
+            vector_results, lexical_results = asyncio.run(run())
+
+        self.assertEqual(vector_results['ids'][0], [f'{self.docs_dir}/a.txt-chk-0'])
+        self.assertEqual(lexical_results['ids'][0], [f'{self.docs_dir}/a.txt-chk-0'])
+
+    def test_query_follows_migration(self):
+        self.make_store(st_embedding_model='model-b', refresh=False).migrate()
+
+        results = asyncio.run(self.store.query('one two three four', 1))
+
+        self.assertEqual(self.store.store.active_generation, 'tomes-g1')
+        self.assertEqual(results['ids'][0], [f'{self.docs_dir}/a.txt-chk-0'])
+
+    def test_timeout(self):
+
+        async def run():
+            refresh = asyncio.ensure_future(self.store.refresh())
+            await run_in_executor(None, self.refresh_started.wait, 5)
+
+            with self.assertRaises(asyncio.TimeoutError):
+                await self.store.query('one two three four', 1, timeout=0.05)
+
+            # the refresh goes on in the background
+            self.proceed.set()
+            return await refresh
+
+        self.assertTrue(asyncio.run(run()))
+
+
+class TestAsyncLlm(unittest.IsolatedAsyncioTestCase):
+
+    async def test_generations_are_serialized(self):
+        fake_llm = FakeLlm()
+        llm = AsyncLlm(fake_llm)
+
+        replies = await asyncio.gather(
+            llm.chat([{ 'role': 'user', 'content': 'a' }]),
+            llm.chat([{ 'role': 'user', 'content': 'b' }]),
+        )
+
+        self.assertEqual(replies, ['the answer is 42', 'the answer is 42'])
+        self.assertEqual(fake_llm.max_generating, 1)
+
+    async def test_timeout_stops_generation(self):
+        fake_llm = FakeLlm(reply=' '.join(['word'] * 1_000))
+        llm = AsyncLlm(fake_llm)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await llm.chat([{ 'role': 'user', 'content': 'a' }], timeout=0.05)
+
+        # stopped at the next token, before the model is released
+        self.assertEqual(fake_llm.n_generating, 0)
+        self.assertLess(fake_llm.n_streamed, 1_000)
+        self.assertFalse(llm.lock.locked())
+
+    async def test_cancel_stops_generation(self):
+        fake_llm = FakeLlm(reply=' '.join(['word'] * 1_000))
+        llm = AsyncLlm(fake_llm)
+
+        chat = asyncio.ensure_future(llm.chat([{ 'role': 'user', 'content': 'a' }]))
+        await asyncio.sleep(0.05)
+        chat.cancel()
+
+        with self.assertRaises(asyncio.CancelledError):
+            await chat
+        self.assertEqual(fake_llm.n_generating, 0)
+        self.assertLess(fake_llm.n_streamed, 1_000)
+
+
+class TestAnswer(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_docs({ 'a.txt': 'one two three four' })
+        self.store = AsyncDirectoryStore(self.make_store())
+
+    def test_answer(self):
+        llm_response, context = asyncio.run(answer(
+            self.store,
+            AsyncLlm(FakeLlm()),
+            'one two three four',
+            1,
+            query_system_prompt='{context}',
+            context_template='{snippet}',
+        ))
+
+        self.assertEqual(llm_response, 'the answer is 42')
+        self.assertEqual(context['ids'][0], [f'{self.docs_dir}/a.txt-chk-0'])
+
+    def test_timeout(self):
+        fake_llm = FakeLlm(reply=' '.join(['word'] * 1_000))
+
+        start = time.monotonic()
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(answer(
+                self.store,
+                AsyncLlm(fake_llm),
+                'one two three four',
+                1,
+                query_system_prompt='{context}',
+                context_template='{snippet}',
+                timeout=0.2,
+            ))
+
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(fake_llm.n_generating, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
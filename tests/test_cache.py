@@ -0,0 +1,91 @@
+import os
+import random
+import string
+import tempfile
+import unittest
+from que.cache import TextCache
+
+def random_text(n_chars: int, seed: int) -> str:
+    rng = random.Random(seed)
+    return ''.join(rng.choices(string.ascii_letters + string.digits, k=n_chars))
+
+class TestTextCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_folder = os.path.join(self.tmp_dir.name, 'text_cache')
+        self.cache = TextCache(self.cache_folder, max_size_bytes=1024 * 1024)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_put(self):
+        self.assertIsNone(self.cache.get('/docs/a.txt', 'fp', '1'))
+
+        self.cache.put('/docs/a.txt', 'fp', '1', 'some text')
+
+        self.assertEqual(self.cache.get('/docs/a.txt', 'fp', '1'), 'some text')
+        # a changed file, or a new reader version, is never served the old text
+        self.assertIsNone(self.cache.get('/docs/a.txt', 'other fp', '1'))
+        self.assertIsNone(self.cache.get('/docs/a.txt', 'fp', '2'))
+
+    def test_evicts_least_recently_used(self):
+        for i, fname in enumerate(['a', 'b', 'c']):
+            self.cache.put(f'/docs/{fname}.txt', 'fp', '1', random_text(2_000, seed=i))
+
+        # b is the oldest entry, then a, which is then read, making c the least recently used after b
+        entry_a = self.cache.entry_path('/docs/a.txt', 'fp', '1')
+        entry_b = self.cache.entry_path('/docs/b.txt', 'fp', '1')
+        entry_c = self.cache.entry_path('/docs/c.txt', 'fp', '1')
+        os.utime(entry_a, (2_000, 2_000))
+        os.utime(entry_b, (1_000, 1_000))
+        os.utime(entry_c, (3_000, 3_000))
+        self.assertIsNotNone(self.cache.get('/docs/a.txt', 'fp', '1'))
+
+        sizes = { path: size for _, size, path in self.cache.entries() }
+        self.cache.max_size_bytes = sizes[entry_a] + sizes[entry_c]
+        self.cache.evict()
+
+        self.assertIsNone(self.cache.get('/docs/b.txt', 'fp', '1'))
+        self.assertIsNotNone(self.cache.get('/docs/a.txt', 'fp', '1'))
+        self.assertIsNotNone(self.cache.get('/docs/c.txt', 'fp', '1'))
+        self.assertEqual(self.cache.size_bytes, sizes[entry_a] + sizes[entry_c])
+
+    def test_put_evicts_over_size_cap(self):
+        self.cache.put('/docs/a.txt', 'fp', '1', random_text(2_000, seed=0))
+        entry_size = self.cache.size_bytes
+        os.utime(self.cache.entry_path('/docs/a.txt', 'fp', '1'), (1_000, 1_000))
+
+        self.cache.max_size_bytes = entry_size + entry_size // 2
+        self.cache.put('/docs/b.txt', 'fp', '1', random_text(2_000, seed=1))
+
+        self.assertIsNone(self.cache.get('/docs/a.txt', 'fp', '1'))
+        self.assertIsNotNone(self.cache.get('/docs/b.txt', 'fp', '1'))
+        self.assertLessEqual(self.cache.size_bytes, self.cache.max_size_bytes)
+
+    def test_overwritten_entry_size(self):
+        self.cache.put('/docs/a.txt', 'fp', '1', random_text(2_000, seed=0))
+        self.cache.put('/docs/a.txt', 'fp', '1', random_text(1_000, seed=1))
+        self.cache.put('/docs/a.txt', 'fp', '1', random_text(3_000, seed=2))
+
+        self.assertEqual(self.cache.size_bytes, sum(size for _, size, _ in self.cache.entries()))
+
+    def test_read_only(self):
+        self.cache.put('/docs/a.txt', 'fp', '1', 'some text')
+        entry_a = self.cache.entry_path('/docs/a.txt', 'fp', '1')
+        os.utime(entry_a, (1_000, 1_000))
+
+        read_only_cache = TextCache(self.cache_folder, max_size_bytes=1024 * 1024, read_only=True)
+        read_only_cache.put('/docs/b.txt', 'fp', '1', 'other text')
+
+        self.assertEqual(read_only_cache.get('/docs/a.txt', 'fp', '1'), 'some text')
+        self.assertEqual(os.stat(entry_a).st_mtime, 1_000)
+        self.assertIsNone(read_only_cache.get('/docs/b.txt', 'fp', '1'))
+
+        missing_folder = os.path.join(self.tmp_dir.name, 'missing')
+        TextCache(missing_folder, max_size_bytes=1024, read_only=True)
+        self.assertFalse(os.path.exists(missing_folder))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from que.cli import PARTIAL_ANSWER_NOTES, format_partial_answer, highlight
+
+class TestFormatPartialAnswer(unittest.TestCase):
+
+    def setUp(self):
+        self.context = {
+            'ids': [ ['a-0', 'a-1', 'b-0'] ],
+            'documents': [ ['one', 'two', 'three'] ],
+            'metadatas': [ [ { 'source': '/docs/a.txt' }, { 'source': '/docs/a.txt' }, { 'source': '/docs/b.txt' } ] ],
+        }
+
+    def test_deadline(self):
+        res = format_partial_answer('{"answer": "The report is due on', self.context)
+
+        self.assertTrue(res.startswith(highlight('The report is due on...')))
+        self.assertIn(PARTIAL_ANSWER_NOTES['deadline'], res)
+        self.assertNotIn(PARTIAL_ANSWER_NOTES['length'], res)
+        # every source once, in rank order
+        self.assertTrue(res.endswith('Retrieved sources:\n\t/docs/a.txt\n\t/docs/b.txt\n'))
+
+    def test_length_limit(self):
+        res = format_partial_answer('{"answer": "The report is due on \\"friday\\"", "confidence_score": 0.', self.context, stop_reason='length')
+
+        self.assertTrue(res.startswith(highlight('The report is due on \\"friday\\"...')))
+        self.assertIn(PARTIAL_ANSWER_NOTES['length'], res)
+        self.assertNotIn(PARTIAL_ANSWER_NOTES['deadline'], res)
+
+    def test_not_json(self):
+        res = format_partial_answer('The report is due on friday', self.context, stop_reason='stop')
+
+        self.assertTrue(res.startswith(highlight('The report is due on friday...')))
+        self.assertIn(PARTIAL_ANSWER_NOTES['stop'], res)
+
+    def test_no_answer(self):
+        res = format_partial_answer('', self.context)
+
+        self.assertTrue(res.startswith('-'*10 + PARTIAL_ANSWER_NOTES['deadline']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+from que.config import fill_missing_from_default, load_default_config
+
+class TestFillMissingFromDefault(unittest.TestCase):
+
+    def test_fills_missing_fields(self):
+        config = { 'model': { 'model_id': 'user/model' } }
+        default_config = { 'model': { 'model_id': 'default/model', 'quant': '*Q4*' }, 'cache': { 'max_size_mb': 512 } }
+
+        self.assertEqual(
+            fill_missing_from_default(config, default_config),
+            { 'model': { 'model_id': 'user/model', 'quant': '*Q4*' }, 'cache': { 'max_size_mb': 512 } }
+        )
+
+    def test_keeps_user_values(self):
+        config = { 'verbose': True, 'index': 'not a table' }
+        default_config = { 'verbose': False, 'index': { 'refresh_lock_timeout': 30 } }
+
+        self.assertEqual(fill_missing_from_default(config, default_config), { 'verbose': True, 'index': 'not a table' })
+
+    def test_old_config_gets_new_sections(self):
+        default_config = load_default_config()
+        old_config = { field: value for field, value in default_config.items() if field not in ('index', 'cache') }
+
+        self.assertEqual(fill_missing_from_default(old_config, load_default_config()), default_config)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+from typing import List
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+import numpy as np
+from que.embeddings import ShardedSentenceTransformerEmbeddingFunction
+
+def make_tiny_model(model_dir: str):
+    # a small randomly initialized BERT with a letter vocabulary, so that nothing is downloaded
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    bert_dir = os.path.join(model_dir, 'bert')
+    os.makedirs(bert_dir)
+    letters = [ chr(c) for c in range(ord('a'), ord('z') + 1) ]
+    with open(os.path.join(bert_dir, 'vocab.txt'), 'w') as f:
+        f.write('\n'.join(['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]'] + letters + [ f'##{letter}' for letter in letters ]))
+
+    torch.manual_seed(0)
+    BertTokenizerFast(os.path.join(bert_dir, 'vocab.txt')).save_pretrained(bert_dir)
+    BertModel(BertConfig(vocab_size=57, hidden_size=32, num_hidden_layers=2, num_attention_heads=2, intermediate_size=64)).save_pretrained(bert_dir)
+    SentenceTransformer(modules=[models.Transformer(bert_dir), models.Pooling(32)]).save(model_dir)
+
+def embed_in_process(model_dir: str, documents: List[str], batch_size: int) -> List[List[float]]:
+    make_tiny_model(model_dir)
+    return ShardedSentenceTransformerEmbeddingFunction(model_dir, device='cpu', workers=0, batch_size=batch_size)(documents)
+
+class TestShardedSentenceTransformerEmbeddingFunction(unittest.TestCase):
+
+    def test_model_is_loaded_once(self):
+        embedding_function = ShardedSentenceTransformerEmbeddingFunction('model-a', device='cpu')
+
+        def slow_load(*args, **kwargs):
+            time.sleep(0.05)
+            return mock.Mock()
+
+        load = mock.Mock(side_effect=slow_load)
+        with mock.patch.dict(sys.modules, { 'sentence_transformers': mock.Mock(SentenceTransformer=load) }):
+            threads = [ threading.Thread(target=embedding_function.get_model) for _ in range(4) ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        load.assert_called_once_with('model-a', device='cpu')
+
+    def test_workers_match_single_process(self):
+        documents = [ ' '.join(['word'] * (i % 40 + 1)) + f' doc {i}' for i in range(100) ]
+        spawn = multiprocessing.get_context('spawn')
+
+        # the models only run in other processes, keeping transformers out of the test process
+        with tempfile.TemporaryDirectory() as tmp_dir, ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+            model_dir = os.path.join(tmp_dir, 'tiny')
+            expected = executor.submit(embed_in_process, model_dir, documents, 8).result()
+
+            embedding_function = ShardedSentenceTransformerEmbeddingFunction(model_dir, device='cpu', workers=2, batch_size=8)
+            try:
+                embeddings = embedding_function(documents)
+            finally:
+                embedding_function.close()
+
+        self.assertEqual(np.asarray(embeddings, dtype=np.float32).tobytes(), np.asarray(expected, dtype=np.float32).tobytes())
+
+
+if __name__ == '__main__':
+    unittest.main()
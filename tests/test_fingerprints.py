@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+from que.fingerprints import FILE_CHANGED, FILE_DELETED, FILE_TOUCHED, FILE_UNCHANGED, check_file, get_content_digest, get_file_fingerprint
+
+class TestCheckFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.fname = os.path.join(self.tmp_dir.name, 'a.txt')
+        with open(self.fname, 'w') as f:
+            f.write('some text')
+        os.utime(self.fname, (1_000, 1_000))
+
+        self.fingerprint = get_file_fingerprint(self.fname)
+        self.digest = get_content_digest(self.fname)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_unchanged(self):
+        self.assertEqual(check_file(self.fname, self.fingerprint, self.digest), (FILE_UNCHANGED, self.fingerprint, self.digest))
+
+    def test_touched(self):
+        os.utime(self.fname, (2_000, 2_000))
+
+        status, fingerprint, digest = check_file(self.fname, self.fingerprint, self.digest)
+
+        self.assertEqual(status, FILE_TOUCHED)
+        self.assertNotEqual(fingerprint, self.fingerprint)
+        self.assertEqual(fingerprint, get_file_fingerprint(self.fname))
+        self.assertEqual(digest, self.digest)
+
+    def test_changed(self):
+        with open(self.fname, 'w') as f:
+            f.write('other text')
+
+        status, fingerprint, digest = check_file(self.fname, self.fingerprint, self.digest)
+
+        self.assertEqual(status, FILE_CHANGED)
+        self.assertEqual(fingerprint, get_file_fingerprint(self.fname))
+        self.assertEqual(digest, get_content_digest(self.fname))
+        self.assertNotEqual(digest, self.digest)
+
+    def test_changed_without_stored_digest(self):
+        os.utime(self.fname, (2_000, 2_000))
+
+        # indexed before content digests were recorded
+        self.assertEqual(check_file(self.fname, self.fingerprint, None)[0], FILE_CHANGED)
+        self.assertEqual(check_file(self.fname, get_file_fingerprint(self.fname), None)[0], FILE_UNCHANGED)
+
+    def test_deleted(self):
+        os.remove(self.fname)
+
+        self.assertEqual(check_file(self.fname, self.fingerprint, self.digest), (FILE_DELETED, None, None))
+
+    def test_content_digest_blocks(self):
+        with open(self.fname, 'wb') as f:
+            f.write(os.urandom(10_000))
+
+        self.assertEqual(get_content_digest(self.fname, block_size=7), get_content_digest(self.fname))
+
+
+if __name__ == '__main__':
+    unittest.main()
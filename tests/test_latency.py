@@ -0,0 +1,132 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from que.latency import DEFAULT_MODEL_RATES, LatencyBudget, load_model_rates, pack_context, save_model_rates, timed_chat, update_model_rates
+from tests.utils import FakeLlm
+
+class TestLatencyBudget(unittest.TestCase):
+
+    def make_budget(self, remaining_s: float) -> LatencyBudget:
+        budget = LatencyBudget(60, dict(DEFAULT_MODEL_RATES))
+        # freeze the clock
+        budget.remaining = mock.Mock(return_value=remaining_s)
+        return budget
+
+    def test_plan(self):
+        budget = self.make_budget(100)
+
+        # 90s available, half of them for at most 225 generated tokens at 5 tokens/s, the rest for prompt evaluation
+        self.assertEqual(budget.plan(prompt_tokens=500), (4_000, 225))
+
+    def test_plan_model_not_loaded(self):
+        budget = self.make_budget(100)
+
+        # the 10s load time is deducted first
+        self.assertEqual(budget.plan(prompt_tokens=500, model_is_loaded=False), (3_500, 200))
+
+    def test_plan_generation_bounds(self):
+        self.assertEqual(self.make_budget(1_000).plan(prompt_tokens=0)[1], 512)
+        self.assertEqual(self.make_budget(0).plan(prompt_tokens=0), (0, 48))
+
+    def test_plan_k(self):
+        budget = self.make_budget(100)
+
+        self.assertEqual(budget.plan_k(10, prompt_tokens=500, tokens_per_chunk=100), 10)
+        self.assertEqual(budget.plan_k(50, prompt_tokens=500, tokens_per_chunk=100), 35)
+        # at least one chunk is always retrieved
+        self.assertEqual(self.make_budget(0).plan_k(50, prompt_tokens=500, tokens_per_chunk=100), 1)
+
+    def test_is_expired(self):
+        self.assertFalse(self.make_budget(1).is_expired())
+        self.assertTrue(self.make_budget(0).is_expired())
+
+    def test_can_evaluate(self):
+        budget = self.make_budget(100)
+
+        # 90s available at 100 tokens/s
+        self.assertTrue(budget.can_evaluate(9_000))
+        self.assertFalse(budget.can_evaluate(9_001))
+
+
+class TestPackContext(unittest.TestCase):
+
+    def setUp(self):
+        self.context = {
+            'ids': [ ['a-0', 'a-1', 'b-0'] ],
+            'documents': [ ['one two three', 'four five', 'six'] ],
+            'metadatas': [ [ { 'source': '/docs/a.txt' }, { 'source': '/docs/a.txt' }, { 'source': '/docs/b.txt' } ] ],
+            'distances': [ [0.1, 0.2, 0.3] ],
+        }
+
+    def pack(self, max_context_tokens):
+        # chunks take 4, 3 and 2 tokens
+        return pack_context(FakeLlm(), self.context, '{fname} {snippet}', max_context_tokens)
+
+    def test_keeps_best_ranked(self):
+        packed = self.pack(8)
+
+        self.assertEqual(packed['ids'], [ ['a-0', 'a-1'] ])
+        self.assertEqual(packed['documents'], [ ['one two three', 'four five'] ])
+        self.assertEqual(packed['metadatas'][0], self.context['metadatas'][0][:2])
+        self.assertEqual(packed['distances'], [ [0.1, 0.2] ])
+
+    def test_all_fit(self):
+        self.assertEqual(self.pack(9), self.context)
+
+    def test_none_fit(self):
+        # chunks after the first one that does not fit are not used either, so that the best ranked chunk is never skipped
+        self.assertEqual(self.pack(3)['documents'], [ [] ])
+
+
+class TestTimedChat(unittest.TestCase):
+
+    def chat(self, remaining_s, max_tokens):
+        budget = LatencyBudget(60, dict(DEFAULT_MODEL_RATES))
+        budget.remaining = mock.Mock(return_value=remaining_s)
+        return timed_chat(FakeLlm(token_delay_s=0), [ { 'role': 'user', 'content': 'what is the answer' } ], budget, max_tokens)
+
+    def test_stop(self):
+        llm_response, stop_reason, measured = self.chat(100, max_tokens=10)
+
+        self.assertEqual(llm_response, 'the answer is 42')
+        self.assertEqual(stop_reason, 'stop')
+        self.assertEqual(set(measured), { 'prompt_eval_tps', 'generation_tps' })
+
+    def test_length(self):
+        llm_response, stop_reason, _ = self.chat(100, max_tokens=2)
+
+        self.assertEqual(llm_response, 'the answer')
+        self.assertEqual(stop_reason, 'length')
+
+    def test_deadline(self):
+        llm_response, stop_reason, _ = self.chat(0, max_tokens=10)
+
+        self.assertEqual(llm_response, 'the')
+        self.assertEqual(stop_reason, 'deadline')
+
+
+class TestModelRates(unittest.TestCase):
+
+    def test_update_model_rates(self):
+        rates = { 'load_s': 10.0, 'prompt_eval_tps': 100.0, 'generation_tps': 5.0 }
+
+        updated = update_model_rates(rates, { 'generation_tps': 15.0 })
+
+        self.assertEqual(updated, { 'load_s': 10.0, 'prompt_eval_tps': 100.0, 'generation_tps': 10.0 })
+        self.assertEqual(update_model_rates(rates, { 'load_s': 20.0 }, smoothing=1)['load_s'], 20.0)
+
+    def test_load_save_model_rates(self):
+        with tempfile.TemporaryDirectory() as config_folder:
+            self.assertEqual(load_model_rates(config_folder, 'model/a'), DEFAULT_MODEL_RATES)
+
+            save_model_rates(config_folder, 'model/a', { **DEFAULT_MODEL_RATES, 'generation_tps': 20.0 })
+            save_model_rates(config_folder, 'model/b', { **DEFAULT_MODEL_RATES, 'load_s': 1.0 })
+
+            self.assertEqual(load_model_rates(config_folder, 'model/a')['generation_tps'], 20.0)
+            self.assertEqual(load_model_rates(config_folder, 'model/b')['load_s'], 1.0)
+            self.assertEqual(os.listdir(config_folder), ['model_rates.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from que.lexical import LexicalIndex, reciprocal_rank_fusion
+
+def ranking(ids):
+    return {
+        'ids': [ ids ],
+        'documents': [ [ f'text of {doc_id}' for doc_id in ids ] ],
+        'metadatas': [ [ { 'source': f'/docs/{doc_id}' } for doc_id in ids ] ],
+        'distances': [ [ 0.0 for _ in ids ] ],
+    }
+
+class TestLexicalIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index_fname = os.path.join(self.tmp_dir.name, 'lexical.sqlite')
+        self.index = LexicalIndex(self.index_fname)
+        self.index.upsert(
+            ['/docs/a.txt#0', '/docs/a.txt#1', '/docs/sub/b.txt#0', '/docs2/c.txt#0'],
+            ['the quarterly report is due friday', 'nothing relevant here', 'report deadline moved', 'another report'],
+            [ { 'source': '/docs/a.txt' }, { 'source': '/docs/a.txt' }, { 'source': '/docs/sub/b.txt' }, { 'source': '/docs2/c.txt' } ]
+        )
+
+    def tearDown(self):
+        self.index.db.close()
+        self.tmp_dir.cleanup()
+
+    def query_ids(self, query_txt, k=10, dir_scope=None, index=None):
+        return (index or self.index).query(query_txt, k, dir_scope=dir_scope)['ids'][0]
+
+    def test_query(self):
+        self.assertEqual(self.index.count(), 4)
+        self.assertEqual(set(self.query_ids('report')), { '/docs/a.txt#0', '/docs/sub/b.txt#0', '/docs2/c.txt#0' })
+        self.assertEqual(self.query_ids('friday'), ['/docs/a.txt#0'])
+        self.assertEqual(len(self.query_ids('report', k=1)), 1)
+        self.assertEqual(self.query_ids('missing'), [])
+        self.assertEqual(self.query_ids('   '), [])
+
+    def test_query_source(self):
+        self.assertEqual(self.query_ids('b.txt'), ['/docs/sub/b.txt#0'])
+        self.assertEqual(set(self.query_ids('docs2')), { '/docs2/c.txt#0' })
+
+        # the chunk text ranks above the source path
+        self.index.upsert(['/docs/report.txt#0'], ['unrelated words'], [ { 'source': '/docs/report.txt' } ])
+        ids = self.query_ids('report')
+        self.assertEqual(len(ids), 4)
+        self.assertEqual(ids[-1], '/docs/report.txt#0')
+
+    def test_upgrade_index_without_sources(self):
+        self.index.db.close()
+        os.remove(self.index_fname)
+        with sqlite3.connect(self.index_fname) as db:
+            db.execute('CREATE TABLE chunk_ids (rowid INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, source TEXT NOT NULL)')
+            db.execute("CREATE VIRTUAL TABLE chunks USING fts5(document, tokenize='unicode61')")
+            db.execute("INSERT INTO chunk_ids (rowid, id, source) VALUES (1, '/docs/a.txt#0', '/docs/a.txt')")
+            db.execute("INSERT INTO chunks (rowid, document) VALUES (1, 'the quarterly report')")
+        db.close()
+
+        # emptied, to be rebuilt by the store
+        self.index = LexicalIndex(self.index_fname)
+        self.assertEqual(self.index.count(), 0)
+
+        self.index.rebuild(['/docs/a.txt#0'], ['the quarterly report'], [ { 'source': '/docs/a.txt' } ])
+        self.assertEqual(self.query_ids('a.txt'), ['/docs/a.txt#0'])
+
+    def test_query_syntax_is_quoted(self):
+        self.assertEqual(self.query_ids('"friday" OR NEAR(report'), ['/docs/a.txt#0'])
+
+    def test_scoped_query(self):
+        self.assertEqual(set(self.query_ids('report', dir_scope='/docs')), { '/docs/a.txt#0', '/docs/sub/b.txt#0' })
+        self.assertEqual(self.query_ids('report', dir_scope='/docs/sub/'), ['/docs/sub/b.txt#0'])
+        self.assertEqual(self.query_ids('report', dir_scope='/docs2'), ['/docs2/c.txt#0'])
+
+    def test_upsert_replaces_chunks(self):
+        self.index.upsert(['/docs/a.txt#0'], ['the annual review'], [ { 'source': '/docs/a.txt' } ])
+
+        self.assertEqual(self.index.count(), 4)
+        self.assertEqual(self.query_ids('friday'), [])
+        self.assertEqual(self.query_ids('annual'), ['/docs/a.txt#0'])
+
+    def test_delete_sources(self):
+        self.index.delete_sources(['/docs/a.txt', '/docs2/c.txt'])
+
+        self.assertEqual(self.index.count(), 1)
+        self.assertEqual(self.query_ids('report'), ['/docs/sub/b.txt#0'])
+
+    def test_rebuild(self):
+        self.index.rebuild(['/docs/d.txt#0'], ['fresh report'], [ { 'source': '/docs/d.txt' } ])
+
+        self.assertEqual(self.index.count(), 1)
+        self.assertEqual(self.query_ids('report'), ['/docs/d.txt#0'])
+
+    def test_read_only(self):
+        read_only_index = LexicalIndex(self.index_fname, read_only=True)
+        self.assertEqual(set(self.query_ids('report', dir_scope='/docs', index=read_only_index)), { '/docs/a.txt#0', '/docs/sub/b.txt#0' })
+        read_only_index.db.close()
+
+        missing_fname = os.path.join(self.tmp_dir.name, 'missing.sqlite')
+        missing_index = LexicalIndex(missing_fname, read_only=True)
+        self.assertEqual(missing_index.count(), 0)
+        self.assertEqual(self.query_ids('report', index=missing_index), [])
+        self.assertFalse(os.path.exists(missing_fname))
+
+
+class TestReciprocalRankFusion(unittest.TestCase):
+
+    def test_fusion(self):
+        fused = reciprocal_rank_fusion([ ranking(['x', 'y', 'z']), ranking(['y', 'z', 'w']) ], k=4)
+
+        self.assertEqual(fused['ids'][0], ['y', 'z', 'x', 'w'])
+        self.assertEqual(fused['documents'][0][0], 'text of y')
+        self.assertEqual(fused['metadatas'][0][0], { 'source': '/docs/y' })
+        # better fused chunks have lower distances, like the vector DB results
+        self.assertEqual(fused['distances'][0], sorted(fused['distances'][0]))
+
+    def test_keeps_k(self):
+        fused = reciprocal_rank_fusion([ ranking(['x', 'y', 'z']), ranking(['y', 'z', 'w']) ], k=2)
+
+        self.assertEqual(fused['ids'][0], ['y', 'z'])
+
+    def test_empty(self):
+        fused = reciprocal_rank_fusion([ ranking([]), ranking([]) ], k=2)
+
+        self.assertEqual(fused['ids'][0], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
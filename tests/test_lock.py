@@ -0,0 +1,110 @@
+import os
+import tempfile
+import threading
+import unittest
+from que.lock import FileLock, ReadWriteLock
+
+class TestFileLock(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.lock_fname = os.path.join(self.tmp_dir.name, 'test.lock')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_exclusive(self):
+        lock = FileLock(self.lock_fname)
+        other_lock = FileLock(self.lock_fname)
+
+        self.assertTrue(lock.try_acquire())
+        self.assertFalse(other_lock.try_acquire())
+        self.assertFalse(other_lock.acquire(timeout=0.2, poll_interval=0.05))
+
+        lock.release()
+        self.assertTrue(other_lock.try_acquire())
+        other_lock.release()
+
+    @unittest.skipIf(os.name == 'nt', 'Shared locks are exclusive on Windows')
+    def test_shared(self):
+        reader = FileLock(self.lock_fname, shared=True)
+        other_reader = FileLock(self.lock_fname, shared=True)
+        writer = FileLock(self.lock_fname)
+
+        self.assertTrue(reader.try_acquire())
+        self.assertTrue(other_reader.try_acquire())
+        self.assertFalse(writer.try_acquire())
+
+        reader.release()
+        other_reader.release()
+        self.assertTrue(writer.try_acquire())
+        self.assertFalse(reader.try_acquire())
+        writer.release()
+
+    def test_read_only_does_not_create(self):
+        lock = FileLock(self.lock_fname, shared=True, read_only=True)
+
+        self.assertFalse(lock.try_acquire())
+        self.assertFalse(os.path.exists(self.lock_fname))
+        # releasing a lock that is not held does nothing
+        lock.release()
+
+    @unittest.skipIf(os.name == 'nt', 'Shared locks are exclusive on Windows')
+    def test_read_only_existing_file(self):
+        # created by a writable store
+        open(self.lock_fname, 'w').close()
+        reader = FileLock(self.lock_fname, shared=True, read_only=True)
+        writer = FileLock(self.lock_fname)
+
+        self.assertTrue(reader.try_acquire())
+        self.assertFalse(writer.try_acquire())
+        reader.release()
+
+    def test_context_manager(self):
+        with FileLock(self.lock_fname) as lock:
+            self.assertIsNotNone(lock.fd)
+            self.assertFalse(FileLock(self.lock_fname).try_acquire())
+        self.assertIsNone(lock.fd)
+
+
+class TestReadWriteLock(unittest.TestCase):
+
+    def test_readers_share(self):
+        lock = ReadWriteLock()
+        # both readers must hold the lock at once to get past the barrier
+        barrier = threading.Barrier(2, timeout=5)
+
+        def read():
+            with lock.read():
+                barrier.wait()
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        read()
+        reader.join()
+
+    def test_writer_excludes(self):
+        lock = ReadWriteLock()
+        events = []
+        is_writing = threading.Event()
+
+        def write():
+            with lock.write():
+                is_writing.set()
+                events.append('write')
+                # a reader arriving now must wait
+                threading.Event().wait(0.1)
+                events.append('written')
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        is_writing.wait(5)
+        with lock.read():
+            events.append('read')
+        writer.join()
+
+        self.assertEqual(events, ['write', 'written', 'read'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+from unittest import mock
+from que.store import MISSING_COLLECTION_ERRORS
+from tests.utils import StoreTestCase
+
+class TestMigration(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_docs({
+            'a.txt': 'one two three four five six seven eight',
+            'b.txt': 'alpha beta gamma delta',
+        })
+        self.db_a = self.make_store()
+
+    def collection_exists(self, db, name):
+        try:
+            db.client.get_collection(name)
+        except MISSING_COLLECTION_ERRORS:
+            return False
+        return True
+
+    def test_no_background_migration_by_default(self):
+        with mock.patch('que.store.subprocess.Popen') as popen:
+            db_b = self.make_store(st_embedding_model='model-b', refresh=False)
+
+        popen.assert_not_called()
+        self.assertEqual(db_b.active_embedding_model, 'model-a')
+
+    def test_background_migration(self):
+        with mock.patch('que.store.subprocess.Popen') as popen:
+            self.make_store(st_embedding_model='model-b', refresh=False, background_migration=True)
+
+        popen.assert_called_once()
+        self.assertEqual(popen.call_args.args[0][-3:], ['-m', 'que.cli', 'migrate'])
+
+    def test_migrate(self):
+        db_b = self.make_store(st_embedding_model='model-b', refresh=False)
+
+        self.assertTrue(db_b.migrate())
+
+        index_state = db_b.load_index_state()
+        self.assertEqual(index_state, { 'active': 'tomes-g1', 'building': None, 'retired': ['tomes'], 'revision': 2 })
+        self.assertEqual(db_b.active_generation, 'tomes-g1')
+        self.assertEqual(db_b.active_embedding_model, 'model-b')
+        self.assertEqual(db_b.collection.metadata['embedding_model'], 'model-b')
+        self.assertEqual(db_b.collection.metadata['generation'], 1)
+        self.assertEqual(self.indexed_chunks(db_b), self.indexed_chunks(self.db_a))
+
+        # nothing left to migrate
+        self.assertFalse(db_b.migrate())
+
+    def test_old_generation_is_kept_while_read(self):
+        db_b = self.make_store(st_embedding_model='model-b', refresh=False)
+        db_b.migrate()
+
+        # db_a still reads the old generation
+        db_b.collect_retired_generations()
+        self.assertTrue(self.collection_exists(db_b, 'tomes'))
+        self.assertEqual(db_b.load_index_state()['retired'], ['tomes'])
+
+        # querying switches db_a to the new generation, releasing the old one
+        results = self.db_a.query('alpha beta gamma delta', 1)
+        self.assertEqual(self.db_a.active_generation, 'tomes-g1')
+        self.assertEqual(self.db_a.active_embedding_model, 'model-b')
+        self.assertEqual(results['ids'][0], [f'{self.docs_dir}/b.txt-chk-0'])
+
+        db_b.collect_retired_generations()
+        self.assertFalse(self.collection_exists(db_b, 'tomes'))
+        self.assertEqual(db_b.load_index_state()['retired'], [])
+
+    def test_refresh_follows_migration(self):
+        db_b = self.make_store(st_embedding_model='model-b', refresh=False)
+        db_b.migrate()
+
+        self.write_docs({ 'c.txt': 'new file' })
+        self.assertTrue(self.db_a.refresh())
+
+        self.assertEqual(self.db_a.active_generation, 'tomes-g1')
+        self.assertIn(f'{self.docs_dir}/c.txt-chk-0', self.indexed_chunks(db_b))
+
+    def test_open_collects_retired_generations(self):
+        db_b = self.make_store(st_embedding_model='model-b', refresh=False)
+        db_b.migrate()
+        self.db_a.held_generation_lock.release()
+
+        self.make_store(st_embedding_model='model-b', refresh=False)
+
+        self.assertFalse(self.collection_exists(db_b, 'tomes'))
+        self.assertEqual(db_b.load_index_state()['retired'], [])
+
+    def test_migration_resumes(self):
+        db_b = self.make_store(st_embedding_model='model-b', refresh=False)
+
+        # interrupted after the first batch
+        with mock.patch.object(type(db_b), 'copy_pending_chunks', side_effect=[2, KeyboardInterrupt]):
+            with self.assertRaises(KeyboardInterrupt):
+                db_b.migrate(batch_size=2)
+        self.assertEqual(db_b.load_index_state()['building'], 'tomes-g1')
+        self.assertEqual(db_b.active_generation, 'tomes')
+
+        self.assertTrue(db_b.migrate(batch_size=2))
+        self.assertEqual(self.indexed_chunks(db_b), self.indexed_chunks(self.db_a))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+from que.readers import DocumentReader, ReaderRegistry, TEXT_READER, PDF_READER
+
+class FakeEntryPoint:
+
+    def __init__(self, name, reader=None, error=None):
+        self.name = name
+        self.reader = reader
+        self.error = error
+
+    def load(self):
+        if self.error is not None:
+            raise self.error
+        return self.reader
+
+class TestReaderRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        # a reader module that is only importable from the temporary folder
+        self.module_name = f'que_test_reader_{os.getpid()}'
+        with open(os.path.join(self.tmp_dir.name, f'{self.module_name}.py'), 'w') as f:
+            f.write('def read_upper(abs_fname):\n    with open(abs_fname) as f:\n        return f.read().upper()\n')
+        sys.path.insert(0, self.tmp_dir.name)
+
+        self.upper_reader = DocumentReader(
+            name='upper',
+            extensions=('.TXT', 'log'),
+            cost='moderate',
+            version='1',
+            target=f'{self.module_name}:read_upper',
+        )
+
+    def tearDown(self):
+        sys.path.remove(self.tmp_dir.name)
+        sys.modules.pop(self.module_name, None)
+        self.tmp_dir.cleanup()
+
+    def make_registry(self, entry_points):
+        registry = ReaderRegistry(builtin_readers=[TEXT_READER, PDF_READER])
+        patcher = mock.patch('que.readers.entry_points', return_value=entry_points)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return registry
+
+    def test_builtin_readers(self):
+        registry = self.make_registry([])
+
+        self.assertEqual(sorted(registry.extensions()), ['md', 'pdf', 'txt'])
+        self.assertIs(registry.get('/docs/A.PDF'), PDF_READER)
+        self.assertIsNone(registry.get('/docs/a.xyz'))
+        self.assertEqual(registry.cost_rank('/docs/a.txt'), 0)
+        self.assertEqual(registry.cost_rank('/docs/a.pdf'), 2)
+        self.assertEqual(registry.cost_rank('/docs/a.xyz'), 3)
+
+    def test_entry_point_discovery(self):
+        registry = self.make_registry([
+            FakeEntryPoint('text', TEXT_READER),
+            FakeEntryPoint('upper', self.upper_reader),
+            FakeEntryPoint('broken', error=ImportError('missing dependency')),
+        ])
+
+        with self.assertWarns(UserWarning):
+            extensions = registry.extensions()
+
+        self.assertEqual(sorted(extensions), ['log', 'md', 'pdf', 'txt'])
+        self.assertIs(registry.get('/docs/a.log'), self.upper_reader)
+
+    def test_plugin_overrides_builtin_extension(self):
+        registry = self.make_registry([ FakeEntryPoint('upper', self.upper_reader) ])
+
+        self.assertIs(registry.get('/docs/a.txt'), self.upper_reader)
+        self.assertIs(registry.get('/docs/a.md'), TEXT_READER)
+
+    def test_reader_is_imported_on_first_read(self):
+        registry = self.make_registry([ FakeEntryPoint('upper', self.upper_reader) ])
+        fname = os.path.join(self.tmp_dir.name, 'a.log')
+        with open(fname, 'w') as f:
+            f.write('some text')
+
+        registry.extensions()
+        self.assertNotIn(self.module_name, sys.modules)
+
+        self.assertEqual(registry.read(fname), 'SOME TEXT')
+        self.assertIn(self.module_name, sys.modules)
+
+    def test_read_unsupported(self):
+        registry = self.make_registry([])
+
+        with self.assertWarns(UserWarning):
+            self.assertEqual(registry.read('/docs/a.xyz'), '')
+
+    def test_invalid_cost(self):
+        with self.assertRaises(AssertionError):
+            DocumentReader(name='bad', extensions=('bad',), cost='free', version='1', target='bad:read')
+
+    def test_explore_current_dir_uses_registry_extensions(self):
+        from que.store import DirectoryStore
+
+        registry = self.make_registry([ FakeEntryPoint('upper', self.upper_reader) ])
+        docs_dir = os.path.join(self.tmp_dir.name, 'docs')
+        os.makedirs(os.path.join(docs_dir, 'sub'))
+        for fname in ['a.txt', 'b.log', 'sub/d.log', 'e.xyz']:
+            with open(os.path.join(docs_dir, fname), 'w') as f:
+                f.write('some text')
+
+        store = DirectoryStore.__new__(DirectoryStore)
+        store.v = False
+
+        cwd = os.getcwd()
+        os.chdir(docs_dir)
+        try:
+            with mock.patch('que.store.READERS', registry):
+                found = store.explore_current_dir()
+        finally:
+            os.chdir(cwd)
+
+        self.assertEqual(
+            sorted(found),
+            sorted(os.path.join(os.path.realpath(docs_dir), fname) for fname in ['a.txt', 'b.log', 'sub/d.log'])
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
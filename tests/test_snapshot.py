@@ -0,0 +1,103 @@
+import os
+import shutil
+import unittest
+from unittest import mock
+import numpy as np
+from que.snapshot import export_snapshot, import_snapshot, pack_strings, unpack_strings
+from tests.utils import FakeEmbeddingFunction, StoreTestCase
+
+class TestPackStrings(unittest.TestCase):
+
+    def test_round_trip(self):
+        strings = ['', 'ascii', 'ünïcödé 文字', 'x' * 1_000]
+
+        buffer, offsets = pack_strings(strings)
+
+        self.assertEqual(buffer.dtype, np.uint8)
+        self.assertEqual(len(buffer), sum(len(string.encode('utf-8')) for string in strings))
+        self.assertEqual(unpack_strings(buffer, offsets), strings)
+
+    def test_empty(self):
+        self.assertEqual(unpack_strings(*pack_strings([])), [])
+
+
+class TestSnapshot(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_docs({
+            'a.txt': 'one two three four five six seven eight',
+            'sub/b.md': 'ünïcödé text in a sub folder',
+        })
+        self.write_docs({ '../outside.txt': 'not under the exported root' })
+        self.snapshot_fname = os.path.join(self.tmp_dir.name, 'docs.npz')
+
+    def test_round_trip_relocated(self):
+        self.make_store()
+        exporting_db = self.make_store(read_only=True)
+        exported_chunks = exporting_db.collection.get(include=['documents', 'embeddings'])
+
+        self.assertEqual(export_snapshot(exporting_db, self.snapshot_fname, root=self.docs_dir), 4)
+
+        # the same tree, mounted somewhere else, on a host with its own index
+        relocated_dir = os.path.join(self.tmp_dir.name, 'mnt', 'docs')
+        shutil.copytree(self.docs_dir, relocated_dir)
+        other_home_dir = os.path.join(self.tmp_dir.name, 'other_home')
+        os.makedirs(f'{other_home_dir}/.config/que')
+        os.chdir(relocated_dir)
+
+        with mock.patch.dict(os.environ, { 'HOME': other_home_dir }):
+            importing_db = self.make_store(refresh=False)
+            self.assertEqual(import_snapshot(importing_db, self.snapshot_fname, root=relocated_dir), 4)
+
+            imported_chunks = importing_db.collection.get(include=['documents', 'embeddings', 'metadatas'])
+            self.assertEqual(
+                sorted(imported_chunks['ids']),
+                sorted(doc_id.replace(self.docs_dir, relocated_dir) for doc_id in exported_chunks['ids'])
+            )
+            exported_by_id = dict(zip(exported_chunks['ids'], zip(exported_chunks['documents'], exported_chunks['embeddings'])))
+            for doc_id, document, embedding, meta in zip(imported_chunks['ids'], imported_chunks['documents'], imported_chunks['embeddings'], imported_chunks['metadatas']):
+                exported_document, exported_embedding = exported_by_id[doc_id.replace(relocated_dir, self.docs_dir)]
+                self.assertEqual(document, exported_document)
+                self.assertEqual(np.asarray(embedding, dtype=np.float32).tobytes(), np.asarray(exported_embedding, dtype=np.float32).tobytes())
+                self.assertTrue(meta['source'].startswith(relocated_dir + os.sep))
+            self.assertEqual(importing_db.lexical.count(), 4)
+
+            # the copied files have new fingerprints, but the same contents, so nothing is embedded again
+            with mock.patch.object(FakeEmbeddingFunction, '__call__', side_effect=AssertionError('embedded again')):
+                self.assertTrue(importing_db.refresh())
+            self.assertEqual(importing_db.collection.count(), 4)
+
+    def test_export_does_not_write(self):
+        self.make_store()
+        config_folder = os.path.join(self.home_dir, '.config', 'que')
+
+        def config_files():
+            return {
+                os.path.join(root, fname): os.stat(os.path.join(root, fname)).st_mtime_ns
+                for root, _, fnames in os.walk(config_folder) for fname in fnames
+                if not fname.startswith('generation-')
+            }
+        files_before = config_files()
+
+        with mock.patch('que.store.subprocess.Popen') as popen:
+            db = self.make_store(st_embedding_model='model-b', read_only=True)
+            export_snapshot(db, self.snapshot_fname, root=self.docs_dir)
+
+        popen.assert_not_called()
+        self.assertEqual(config_files(), files_before)
+
+    def test_import_rejects_other_model(self):
+        self.make_store()
+        export_snapshot(self.make_store(read_only=True), self.snapshot_fname, root=self.docs_dir)
+
+        other_home_dir = os.path.join(self.tmp_dir.name, 'other_home')
+        os.makedirs(f'{other_home_dir}/.config/que')
+        with mock.patch.dict(os.environ, { 'HOME': other_home_dir }):
+            db = self.make_store(st_embedding_model='model-b', refresh=False)
+            with self.assertRaises(AssertionError):
+                import_snapshot(db, self.snapshot_fname, root=self.docs_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import os
+import subprocess
+import sys
+import textwrap
+import unittest
+from unittest import mock
+from que import store
+from que.readers import DocumentReader
+from tests.utils import StoreTestCase
+
+class TestRechunk(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_docs({
+            'a.txt': 'one two three four five six seven eight',
+            'sub/b.md': 'alpha beta gamma delta',
+        })
+        self.db = self.make_store()
+
+    def test_rechunk_from_text_cache(self):
+        self.assertEqual(len(self.indexed_chunks(self.db)), 3)
+
+        self.db.chunk_size = 2
+        self.db.chunk_step = 2
+        with mock.patch.object(DocumentReader, 'read') as read:
+            self.db.rechunk()
+
+        read.assert_not_called()
+        chunks = self.indexed_chunks(self.db)
+        self.assertEqual(len(chunks), 6)
+        self.assertEqual(chunks[f'{self.docs_dir}/a.txt-chk-3'], 'seven eight')
+        self.assertEqual(self.db.lexical.count(), 6)
+
+    def test_read_file_cached(self):
+        abs_fname = f'{self.docs_dir}/a.txt'
+        content_digest = self.db.get_content_digest(abs_fname)
+
+        with mock.patch.object(DocumentReader, 'read') as read:
+            txt = self.db.read_file_cached(abs_fname, content_digest)
+
+        read.assert_not_called()
+        self.assertEqual(txt, 'one two three four five six seven eight')
+
+    def test_rechunk_touched_file(self):
+        abs_fname = f'{self.docs_dir}/a.txt'
+        os.utime(abs_fname, (1_000, 1_000))
+
+        self.db.chunk_size = 2
+        self.db.chunk_step = 2
+        with mock.patch.object(DocumentReader, 'read') as read:
+            self.db.rechunk()
+
+        read.assert_not_called()
+        metadatas = self.db.collection.get(where={ 'source': abs_fname }, include=['metadatas'])['metadatas']
+        self.assertEqual(len(metadatas), 4)
+        self.assertTrue(all(meta['fingerprint'] == self.db.get_file_fingerprint(abs_fname, 'model-a') for meta in metadatas))
+
+    def test_rechunk_skips_changed_file(self):
+        self.write_docs({ 'a.txt': 'completely different text' })
+
+        self.db.chunk_size = 2
+        self.db.chunk_step = 2
+        self.db.rechunk()
+
+        chunks = self.indexed_chunks(self.db)
+        # left for the next refresh
+        self.assertEqual(chunks[f'{self.docs_dir}/a.txt-chk-0'], 'one two three four')
+        self.assertEqual(chunks[f'{self.docs_dir}/sub/b.md-chk-1'], 'gamma delta')
+
+
+class TestReadOnly(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_docs({ 'a.txt': 'one two three four five six seven eight' })
+
+    def test_missing_index(self):
+        with self.assertRaises(FileNotFoundError):
+            self.make_store(read_only=True)
+
+        self.assertEqual(os.listdir(f'{self.home_dir}/.config/que'), [])
+
+    def test_missing_generation_lock(self):
+        self.make_store().held_generation_lock.release()
+        os.remove(f'{self.home_dir}/.config/que/generation-tomes.lock')
+
+        with self.assertWarns(UserWarning):
+            db = self.make_store(read_only=True)
+
+        self.assertFalse(os.path.exists(f'{self.home_dir}/.config/que/generation-tomes.lock'))
+        self.assertEqual(db.query('one two three four', 1)['ids'][0], [f'{self.docs_dir}/a.txt-chk-0'])
+        self.assertEqual(db.query('seven', 1, mode='lexical')['ids'][0], [f'{self.docs_dir}/a.txt-chk-1'])
+
+
+class TestClientSync(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_docs({ 'a.txt': 'one two three four' })
+        self.db = self.make_store()
+
+    def write_from_other_process(self, docs):
+        # refreshes the index with the fake embeddings from another process
+        script = textwrap.dedent('''
+            import os
+            import sys
+            from unittest import mock
+            from que.store import DirectoryStore
+            from tests.utils import FakeEmbeddingFunction
+            # importing the tests package moves the home folder
+            os.environ['HOME'] = sys.argv[1]
+            with mock.patch.object(DirectoryStore, 'make_embedding_function', lambda store, model: FakeEmbeddingFunction(model)):
+                DirectoryStore(chunk_size=4, chunk_step=4, st_embedding_model='model-a')
+        ''')
+        self.write_docs(docs)
+        subprocess.run(
+            [sys.executable, '-c', script, self.home_dir],
+            env={ **os.environ, 'PYTHONPATH': os.path.dirname(os.path.dirname(os.path.abspath(__file__))) },
+            check=True,
+        )
+
+    def test_writes_are_recorded(self):
+        revision = self.db.load_index_state()['revision']
+
+        self.write_docs({ 'b.txt': 'alpha beta gamma delta' })
+        self.db.refresh()
+        self.assertEqual(self.db.load_index_state()['revision'], revision + 1)
+
+        # nothing changed, other processes can keep their client
+        self.db.refresh()
+        self.assertEqual(self.db.load_index_state()['revision'], revision + 1)
+
+    def test_reopens_after_other_process_writes(self):
+        other_db = self.make_store(refresh=False)
+        restarts = store.CLIENT_RESTARTS.get(self.db.findex_name, 0)
+
+        self.write_from_other_process({ 'b.txt': 'alpha beta gamma delta' })
+        self.write_docs({ 'c.txt': 'epsilon zeta eta theta' })
+        self.assertTrue(self.db.refresh())
+
+        self.assertEqual(store.CLIENT_RESTARTS[self.db.findex_name], restarts + 1)
+        self.assertEqual(set(self.indexed_chunks(self.db)), {
+            f'{self.docs_dir}/a.txt-chk-0',
+            f'{self.docs_dir}/b.txt-chk-0',
+            f'{self.docs_dir}/c.txt-chk-0',
+        })
+
+        # other stores of the process reopen the restarted client too
+        self.assertEqual(other_db.query('epsilon zeta eta theta', 1)['ids'][0], [f'{self.docs_dir}/c.txt-chk-0'])
+        self.assertEqual(other_db.client_restarts, restarts + 1)
+
+        # in sync again
+        self.assertTrue(self.db.refresh())
+        self.assertEqual(store.CLIENT_RESTARTS[self.db.findex_name], restarts + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+from typing import Dict, List
+import hashlib
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from que.store import DirectoryStore
+
+class FakeEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    A deterministic embedding function that needs no model. Embeddings depend on the model name,
+    so that index generations built with different models can be told apart
+    """
+
+    def __init__(self, model_name: str) -> None:
+        self.model_name = model_name
+        self.n_embedded = 0
+
+    def __call__(self, input: Documents) -> Embeddings:
+        self.n_embedded += len(input)
+        return [
+            np.frombuffer(hashlib.sha256(f'{self.model_name}<//>{txt}'.encode('utf-8')).digest(), dtype=np.uint8).astype(np.float32) / 255
+            for txt in input
+        ]
+
+
+class FakeLlm:
+    """
+    Streams a fixed reply one word per token, with a delay per token, in the format of `Llama.create_chat_completion`,
+    and tokenizes one word per token. Records how many generations run at once
+    """
+
+    def __init__(self, reply: str = 'the answer is 42', token_delay_s: float = 0.01) -> None:
+        self.reply = reply
+        self.token_delay_s = token_delay_s
+        self.n_generating = 0
+        self.max_generating = 0
+        self.n_streamed = 0
+
+    def tokenize(self, text: bytes, add_bos: bool = True, special: bool = False) -> List[int]:
+        # one token per word
+        return [ 0 ] * len(text.split())
+
+    def create_chat_completion(self, messages: List[Dict[str, str]], max_tokens: int | None = None, stop: List[str] = [], stream: bool = False):
+        assert stream, 'Only streaming is faked'
+        return self.stream(max_tokens)
+
+    def stream(self, max_tokens: int | None):
+        self.n_generating += 1
+        self.max_generating = max(self.max_generating, self.n_generating)
+        try:
+            for i, word in enumerate(self.reply.split(' ')[:max_tokens]):
+                time.sleep(self.token_delay_s)
+                self.n_streamed += 1
+                yield { 'choices': [ { 'delta': { 'content': word if i == 0 else f' {word}' } } ] }
+        finally:
+            self.n_generating -= 1
+
+
+class StoreTestCase(unittest.TestCase):
+    """
+    Runs every test with its own home folder, so that each test gets its own index, and from a documents folder
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.home_dir = os.path.join(self.tmp_dir.name, 'home')
+        self.docs_dir = os.path.realpath(os.path.join(self.tmp_dir.name, 'docs'))
+        os.makedirs(f'{self.home_dir}/.config/que')
+        os.makedirs(self.docs_dir)
+
+        patchers = [
+            mock.patch.dict(os.environ, { 'HOME': self.home_dir }),
+            mock.patch.object(DirectoryStore, 'make_embedding_function', lambda store, model: FakeEmbeddingFunction(model)),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        cwd = os.getcwd()
+        os.chdir(self.docs_dir)
+        self.addCleanup(os.chdir, cwd)
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def write_docs(self, docs: Dict[str, str]):
+        for fname, txt in docs.items():
+            abs_fname = os.path.join(self.docs_dir, fname)
+            os.makedirs(os.path.dirname(abs_fname), exist_ok=True)
+            with open(abs_fname, 'w') as f:
+                f.write(txt)
+
+    def make_store(self, **kwargs) -> DirectoryStore:
+        kwargs = { 'chunk_size': 4, 'chunk_step': 4, 'st_embedding_model': 'model-a', **kwargs }
+        return DirectoryStore(**kwargs)
+
+    def indexed_chunks(self, db: DirectoryStore) -> Dict[str, str]:
+        entries = db.collection.get(include=['documents'])
+        return dict(zip(entries['ids'], entries['documents']))